@@ -1,8 +1,15 @@
+import os
 import random
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from math import inf
-from copy import deepcopy
+import numpy as np
 from checkers import Colour
 from game import Game
+from learner_stats import DRAWN, LOST, SEEN, WON, CompactLearnerStats, StatsColumn, count_outcome
+from move_ordering import HeuristicOrdering
+from transposition import Bound, Replacement, TranspositionTable
 
 
 class RandomAI:
@@ -24,10 +31,13 @@ class RandomAI:
 
 
 class StateLearnerAI:
-    states_seen = {}
-    states_won = {}
-    states_drawn = {}
-    states_lost = {}
+    # Shared by every learner in the process.  Swap in a SharedLearnerStats (see use_stats) to pool what
+    # learners in many processes see; states_seen etc. are read-only dict views of whichever store is in use.
+    stats = CompactLearnerStats()
+    states_seen = StatsColumn(SEEN)
+    states_won = StatsColumn(WON)
+    states_drawn = StatsColumn(DRAWN)
+    states_lost = StatsColumn(LOST)
 
     def __init__(self, game, side, other_side):
         self._game = game
@@ -35,70 +45,51 @@ class StateLearnerAI:
         self._other_side = other_side
         self.id_val = 2
 
+    @classmethod
+    def use_stats(cls, stats):
+        # Also works as a ProcessPoolExecutor initializer, e.g. tournament.run_tournament(..., initargs=(stats,))
+        cls.stats = stats
+
     def move(self, **kwargs):
         move = self.get_best_historical_move(**kwargs)
         return move
 
-    def get_position_rating(self, board_tuple):
-        if board_tuple not in self.states_seen:
+    def get_position_rating(self, state_key):
+        counts = self.stats.get(state_key)
+        if counts is None:
+            return 0
+        num_times_seen, num_times_won, num_times_drawn, num_times_lost = counts
+        if not num_times_seen:
             return 0
-        num_times_seen = self.states_seen[board_tuple]
-        num_times_won = self.states_won[board_tuple]
-        num_times_drawn = self.states_drawn[board_tuple]
-        num_times_lost = self.states_lost[board_tuple]
+        # A sum over every game the position was in, so one loss outweighs any number of wins and draws
+        return num_times_won * 3. + num_times_drawn - 200 * num_times_lost
 
-        return (num_times_won * 3. + num_times_drawn - 200 * num_times_lost) / num_times_seen
+    def get_position_ratings(self, state_keys):
+        # get_position_rating over an array of keys at once
+        counts = self.stats.lookup_many(state_keys).astype(float)
+        ratings = counts[:, WON] * 3. + counts[:, DRAWN] - 200 * counts[:, LOST]
+        return np.where(counts[:, SEEN] > 0, ratings, 0.)
 
     def get_best_historical_move(self, **kwargs):
-        best_move = None
-        best_ranking = None
         pos_moves = self._game.possible_moves(self._side, **kwargs)
         assert len(pos_moves) > 0
-
-        for move in pos_moves:
-            temp_game = self._game.copy(include_history=False) #deepcopy(self._game)
-            temp_game.make_move(move)
-            pos_ranking = self.get_position_rating(self.get_board_tuple(temp_game))
-            if best_ranking is None or pos_ranking > best_ranking:
-                best_move = move
-                best_ranking = pos_ranking
-        return best_move
-
-    def get_board_tuple(self, game):
-        board_list = []
-        for i in range(len(game.board)):
-            for j in range(len(game.board[i])):
-                square = ' '
-                if game.board[i][j] == self._side:
-                    square = 'M'  # my square
-                elif game.board[i][j] != self._other_side:
-                    square = 'E'  # enemy square
-                board_list.append(square)
-        return tuple(board_list)
+        ratings = self.get_position_ratings(self._game.child_keys(pos_moves, self._side))
+        # argmax takes the first of equal ratings, as the one-move-at-a-time version did
+        return pos_moves[int(np.argmax(ratings))]
 
     def win(self):
-        self.update_num_seen()
-        for state in self._game.game_history:
-            self.states_won[state] += 1
+        self.record_game(WON)
 
     def draw(self):
-        self.update_num_seen()
-        for state in self._game.game_history:
-            self.states_drawn[state] += 1
+        self.record_game(DRAWN)
 
     def loss(self):
-        self.update_num_seen()
-        for state in self._game.game_history:
-            # print('Recording: {}'.format(state))
-            self.states_lost[state] += 1
+        self.record_game(LOST)
 
-    def update_num_seen(self):
-        for state in self._game.game_history:
-            if state not in self.states_seen:
-                self.states_seen[state] = 1
-                self.states_won[state] = 0
-                self.states_drawn[state] = 0
-                self.states_lost[state] = 0
+    def record_game(self, outcome):
+        # Every position of the game is flagged as seen and counted once more for the outcome, in one batch.
+        # Positions are recorded in canonical form, so symmetric positions share their statistics.
+        self.stats.merge(count_outcome(self._game.canonical_history(self._side), outcome))
 
 
 class ProjectedStateLearnerAI(StateLearnerAI):
@@ -113,69 +104,346 @@ class ProjectedStateLearnerAI(StateLearnerAI):
         return (my_piece_count - their_piece_count,)
 
 
+class SearchBudgetExceeded(Exception):
+    pass
+
+
+# What AlphaBetaAI.move did, when collect_stats is on.  source is 'search', 'book' or 'forced' (only one
+# legal move).  Counts cover every iteration of the deepening; cutoffs[ply] counts beta cutoffs that many
+# plies from the root, table_cutoffs the searches answered by this process's transposition table (workers
+# keep their own), and copies the copies of the game made, one per move plus one per worker per iteration
+# in a parallel search.
+# effective_branching_factor is nodes ** (1 / completed_depth).
+SearchRecord = namedtuple('SearchRecord', ['turn', 'side', 'source', 'nodes', 'leaf_evaluations', 'cutoffs',
+                                           'table_cutoffs', 'copies', 'completed_depth',
+                                           'effective_branching_factor', 'seconds'])
+
+
 class AlphaBetaAI:
-    def __init__(self, game, side, other_side):
+    TABLEBASE_WIN = 1000
+
+    def __init__(self, game, side, other_side, max_depth=4, time_budget_ms=None, node_budget=None,
+                 tt_megabytes=16, tt_replacement=Replacement.DEPTH_PREFERRED, move_ordering=None,
+                 workers=1, seed=None, tablebase=None, book=None):
         self._game = game
         self._side = side
         self._other_side = other_side
         self._temp_game = game
         self.id_val = 1
+        # Depth is counted in plies from the current position, so the default matches the old fixed
+        # search of every root move to depth 3.  With a time or node budget the search goes as deep as the
+        # budget allows up to max_depth (which may then be None for no limit).
+        if max_depth is None and time_budget_ms is None and node_budget is None:
+            raise ValueError('AlphaBetaAI needs a max_depth, a time budget or a node budget')
+        self._max_depth = max_depth
+        self._time_budget_ms = time_budget_ms
+        self._node_budget = node_budget
+        self._deadline = None
+        self._reached_horizon = False
+        self.nodes = 0
+        self.completed_depth = 0
+        self.principal_variation = []
+        # Kept for the whole game so later moves reuse what earlier searches found.  None turns it off.
+        self.transposition_table = TranspositionTable(tt_megabytes, tt_replacement) if tt_megabytes else None
+        # MoveOrdering() searches moves as generated; the default uses jumps, killers and history
+        self.move_ordering = move_ordering if move_ordering is not None else HeuristicOrdering()
+        self._root_depth = 0
+        # With a seed, ties are broken by a hash of the position rather than random.random(), and only
+        # table entries searched to exactly the same depth are trusted, so the value of every root move is
+        # the same however, and in whichever process, the search reaches it.
+        self._seed = seed
+        # More than one worker splits the root moves across a process pool
+        self._workers = workers
+        self._executor = None
+        self._search_number = 0
+        # A tablebase.Tablebase; positions it covers are scored exactly instead of searched
+        self.tablebase = tablebase
+        self._settings = dict(max_depth=max_depth, time_budget_ms=time_budget_ms, node_budget=node_budget,
+                              tt_megabytes=tt_megabytes, tt_replacement=tt_replacement,
+                              move_ordering=self.move_ordering, seed=seed, tablebase=tablebase)
+        # An opening_book.OpeningBook; its move is played without searching wherever it has one
+        self.book = book
+        # Can be switched at any time; when on, each move leaves a SearchRecord in last_search
+        self.collect_stats = False
+        self.last_search = None
+        self._source = None
+        self._leaf_evaluations = 0
+        self._cutoffs = []
+        self._copies = 0
 
     def move(self, **kwargs):
-        best_move = None
-        best_value = -inf
-        pos_moves = self._game.possible_moves(self._side)
+        """Search with iterative deepening and return the best move of the deepest completed iteration."""
+        if not self.collect_stats:
+            self.last_search = None
+            return self._move(**kwargs)
+        start = time.perf_counter()
+        table_cutoffs = self.transposition_table.cutoffs if self.transposition_table else 0
+        self._leaf_evaluations = 0
+        self._cutoffs = []
+        self._copies = 0
+        best_move = self._move(**kwargs)
+        if self.transposition_table:
+            table_cutoffs = self.transposition_table.cutoffs - table_cutoffs
+        branching = self.nodes ** (1. / self.completed_depth) if self.completed_depth else None
+        self.last_search = SearchRecord(self._game.turn_count, self._side.name, self._source, self.nodes,
+                                        self._leaf_evaluations, tuple(self._cutoffs), table_cutoffs,
+                                        self._copies, self.completed_depth, branching,
+                                        time.perf_counter() - start)
+        return best_move
+
+    def _count_cutoff(self, ply: int):
+        while len(self._cutoffs) <= ply:
+            self._cutoffs.append(0)
+        self._cutoffs[ply] += 1
+
+    def _move(self, **kwargs):
+        # The time budget covers the whole move, from here
+        self._deadline = None if self._time_budget_ms is None else time.perf_counter() + self._time_budget_ms / 1000.
+        self._search_number += 1
+        if self.transposition_table:
+            self.transposition_table.new_search()
+        self.move_ordering.new_search()
+        # One copy per move; the search below makes and unmakes moves on it in place
+        node = self._game.copy(include_history=False)
+        self._copies += 1
+        pos_moves = node.possible_moves(self._side)
 
         assert len(pos_moves) > 0
+        self.nodes = 0
+        self.completed_depth = 0
+        if len(pos_moves) == 1:
+            self._source = 'forced'
+            return pos_moves[0]
+        if self.book is not None:
+            book_move = self.book.choose(node, pos_moves)
+            if book_move is not None:
+                self._source = 'book'
+                return book_move
+        self._source = 'search'
+
+        best_move = None
+        pos_moves = self.move_ordering.order(pos_moves, 0)
+        depth = 1
+        while self._max_depth is None or depth <= self._max_depth:
+            self._reached_horizon = False
+            try:
+                best_move = self.search_root(node, pos_moves, depth, **kwargs)
+            except SearchBudgetExceeded:
+                # node was abandoned part way through a line, but it is only a copy
+                break
+            self.completed_depth = depth
+            self.principal_variation = self.get_principal_variation(node, best_move, depth)
+            # Start the next iteration from this one's best move
+            pos_moves.remove(best_move)
+            pos_moves.insert(0, best_move)
+            if not self._reached_horizon:
+                # Every line ended in a finished game, so searching deeper would change nothing
+                break
+            depth += 1
+        assert best_move is not None
+        return best_move
 
-        for move in pos_moves:
-            # Could depth be optimised by if we have to jump or use a specific piece as there are less options
-            temp_game = self._game.copy(include_history=False)  # deepcopy(self._game)
-            temp_game.make_move(deepcopy(move))
-            new_value = self.alphabeta(temp_game, 3, -inf, inf, temp_game.next_player == self._side, **kwargs)
+    def search_root(self, node: Game, pos_moves: list, depth: int, **kwargs):
+        self._root_depth = depth
+        if self._workers > 1:
+            values = self.parallel_root_values(node, pos_moves, depth)
+        else:
+            values = [self.root_value(node, move, depth, **kwargs) for move in pos_moves]
+        best_move = None
+        best_value = -inf
+        for move, new_value in zip(pos_moves, values):
             if new_value >= best_value:
                 best_move = move
                 best_value = new_value
-        assert best_move is not None
         return best_move
 
+    def root_value(self, node: Game, move, depth: int, **kwargs):
+        # Could depth be optimised by if we have to jump or use a specific piece as there are less options
+        undo_token = node.apply(move)
+        value = self.alphabeta(node, depth - 1, -inf, inf, node.next_player == self._side, **kwargs)
+        node.undo(undo_token)
+        return value
+
+    def parallel_root_values(self, node: Game, pos_moves: list, depth: int):
+        """Search the root moves round robin across the worker processes, each with its own table."""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self._workers)
+        time_left = None if self._deadline is None else self._deadline - time.perf_counter()
+        node_budget = None
+        if self._node_budget is not None:
+            node_budget = max(1, (self._node_budget - self.nodes) // self._workers)
+        futures = [self._executor.submit(_search_root_moves, (os.getpid(), id(self)), self._search_number,
+                                         self._settings, node, self._side, self._other_side,
+                                         pos_moves[i::self._workers], depth, self.completed_depth,
+                                         time_left, node_budget, self.collect_stats)
+                   for i in range(min(self._workers, len(pos_moves)))]
+        values = [None] * len(pos_moves)
+        for i, future in enumerate(futures):
+            worker_values, nodes, reached_horizon, leaf_evaluations, cutoffs = future.result()
+            values[i::self._workers] = worker_values
+            self.nodes += nodes
+            self._reached_horizon |= reached_horizon
+            if self.collect_stats:
+                # Each worker is sent its own copy of the game
+                self._copies += 1
+                self._leaf_evaluations += leaf_evaluations
+                self._cutoffs += [0] * (len(cutoffs) - len(self._cutoffs))
+                for ply, count in enumerate(cutoffs):
+                    self._cutoffs[ply] += count
+        return values
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def tie_break(self, node: Game):
+        if self._seed is None:
+            return random.random()
+        # Multiply by a large odd constant to spread the key's bits, then keep the top 53 as a float in [0, 1)
+        mixed = ((node.position_key ^ self._seed) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        return (mixed >> 11) / float(1 << 53)
+
+    def tablebase_value(self, node: Game, probe):
+        # Worth more than any material, and the sooner the win the better
+        result, distance = probe
+        value = result * (self.TABLEBASE_WIN - distance)
+        return (value if node.next_player == self._side else -value) + self.tie_break(node)
+
+    def get_principal_variation(self, node: Game, best_move, depth: int):
+        """Follow the best moves stored in the transposition table from the root."""
+        variation = [best_move]
+        undo_tokens = [node.apply(best_move)]
+        while self.transposition_table and len(variation) < depth:
+            entry = self.transposition_table.lookup(node.position_key)
+            if not entry or entry[3] not in node.possible_moves(node.next_player):
+                break
+            variation.append(entry[3])
+            undo_tokens.append(node.apply(entry[3]))
+        for undo_token in reversed(undo_tokens):
+            node.undo(undo_token)
+        return variation
+
     def alphabeta(self, node: Game, depth: int, alpha: int, beta: int, maximizing_player: bool, **kwargs):
+        self.nodes += 1
+        # The first iteration always completes so there is a move to play; budgets apply after that
+        if self._node_budget is not None and self.nodes > self._node_budget and self.completed_depth:
+            raise SearchBudgetExceeded()
+        # Reading the clock is not free, so only look every 256 nodes
+        if (self._deadline is not None and self.completed_depth and not self.nodes & 255 and
+                time.perf_counter() > self._deadline):
+            raise SearchBudgetExceeded()
+        if self.tablebase is not None:
+            probe = self.tablebase.probe_game(node)
+            if probe is not None:
+                return self.tablebase_value(node, probe)
         if depth == 0 or node.check_end_game():
-            total = 0
+            if depth == 0:
+                self._reached_horizon = True
+            if self.collect_stats:
+                self._leaf_evaluations += 1
             # TODO: Have this sub-function as an input into the AI so it can be more general
             # Should probably value a 0 from one side far more heavily
-            for piece in node.pieces[self._side]:
-                total += 0 if piece.is_dead else 5 if piece.king else 3
-            for piece in node.pieces[self._other_side]:
-                total -= 0 if piece.is_dead else 5 if piece.king else 3
-            return total + random.random()  # random values are try and ensure that ties get picked differently
+            men, kings = node.material(self._side)
+            other_men, other_kings = node.material(self._other_side)
+            total = 3 * (men - other_men) + 5 * (kings - other_kings)
+            return total + self.tie_break(node)  # random values are try and ensure that ties get picked differently
 
+        table = self.transposition_table
+        children = node.possible_moves(side=self._side if maximizing_player else self._other_side)
+        original_alpha, original_beta = alpha, beta
+        hash_move = None
+        if table:
+            entry = table.lookup(node.position_key)
+            if entry:
+                entry_depth, entry_value, entry_bound, entry_move = entry
+                if entry_depth == depth or (entry_depth > depth and self._seed is None):
+                    if entry_bound == Bound.LOWER:
+                        alpha = max(alpha, entry_value)
+                    elif entry_bound == Bound.UPPER:
+                        beta = min(beta, entry_value)
+                    if entry_bound == Bound.EXACT or alpha >= beta:
+                        # The stored search may have stopped at its horizon
+                        self._reached_horizon = True
+                        table.cutoffs += 1
+                        return entry_value
+                hash_move = entry_move
+        ply = self._root_depth - depth
+        children = self.move_ordering.order(children, ply, hash_move)
+
+        best_child = None
         if maximizing_player:
             value = -inf
-            for child in node.possible_moves(side=self._side):  # need child to be something sensible here
-                temp_game = node.copy(include_history=False)  # deepcopy(node)
-                temp_game.make_move(deepcopy(child))
-                value = max(value, self.alphabeta(temp_game, depth - 1, alpha, beta, temp_game.next_player == self._side))
+            for child in children:  # need child to be something sensible here
+                undo_token = node.apply(child)
+                child_value = self.alphabeta(node, depth - 1, alpha, beta, node.next_player == self._side)
+                node.undo(undo_token)
+                if child_value > value:
+                    value, best_child = child_value, child
                 alpha = max(alpha, value)
                 if alpha >= beta:
-                    return value  # + random.random()
-            return value  # + random.random()
+                    self.move_ordering.cutoff(child, ply, depth)
+                    if self.collect_stats:
+                        self._count_cutoff(ply)
+                    break
         else:
             value = +inf
-            for child in node.possible_moves(side=self._other_side):
-                temp_game = node.copy(include_history=False)  # deepcopy(node)
-                temp_game.make_move(deepcopy(child))
-                value = min(value, self.alphabeta(temp_game, depth - 1, alpha, beta, temp_game.next_player == self._side))
+            for child in children:
+                undo_token = node.apply(child)
+                child_value = self.alphabeta(node, depth - 1, alpha, beta, node.next_player == self._side)
+                node.undo(undo_token)
+                if child_value < value:
+                    value, best_child = child_value, child
                 beta = min(beta, value)
                 if beta <= alpha:
-                    return value  # + random.random()
-            return value  # + random.random()
+                    self.move_ordering.cutoff(child, ply, depth)
+                    if self.collect_stats:
+                        self._count_cutoff(ply)
+                    break
+
+        if table:
+            bound = Bound.UPPER if value <= original_alpha else Bound.LOWER if value >= original_beta else Bound.EXACT
+            table.store(node.position_key, depth, value, bound, best_child)
+        return value
 
     def win(self):
-        pass
+        self.close()
 
     def draw(self):
-        pass
+        self.close()
 
     def loss(self):
-        pass
+        self.close()
+
+
+_worker_ais = {}
+
+
+def _search_root_moves(ai_key, search_number, settings, game, side, other_side, moves, depth, completed_depth,
+                       time_left, node_budget, collect_stats=False):
+    """Search some of the root moves for AlphaBetaAI.parallel_root_values inside a worker process.
+
+    Each worker keeps one AlphaBetaAI per calling AI, so its transposition table and history table carry
+    over from one iteration and one move to the next just as they do in a serial search.
+    """
+    ai = _worker_ais.get(ai_key)
+    if ai is None:
+        ai = _worker_ais[ai_key] = AlphaBetaAI(game, side, other_side, **settings)
+        ai._search_number = search_number
+    if ai._search_number != search_number:
+        ai._search_number = search_number
+        if ai.transposition_table:
+            ai.transposition_table.new_search()
+        ai.move_ordering.new_search()
+    ai._game = game
+    ai.nodes = 0
+    ai.completed_depth = completed_depth
+    ai._node_budget = node_budget
+    ai._deadline = None if time_left is None else time.perf_counter() + time_left
+    ai._reached_horizon = False
+    ai._root_depth = depth
+    ai.collect_stats = collect_stats
+    ai._leaf_evaluations = 0
+    ai._cutoffs = []
+    values = [ai.root_value(game, move, depth) for move in moves]
+    return values, ai.nodes, ai._reached_horizon, ai._leaf_evaluations, ai._cutoffs
@@ -0,0 +1,138 @@
+"""A persistent table of per-game summaries that only ever reads the games it hasn't seen.
+
+    store = AnalyticsStore('games_dump/analytics')
+    store.ingest('games_dump/games.rec')     # or a directory of the older dump_*.pkl pickles
+    store.column('white_rate')               # rolling win rates, kept up to date as games arrive
+
+The store is a directory of raw columns, one binary file per column with a row per game, and a
+manifest.json recording how many rows are valid, how far through each source ingestion has got, the
+result totals and the rolling window.  Ingesting appends the new games' game_loader.GameColumns and their
+rolling win/draw rates, which need only the last window - 1 results before them, then rewrites the
+manifest; so refreshing costs time in proportion to the new games.  Rows past the manifest's count are
+left over from an ingest that was interrupted, and are dropped when the store is next opened.
+"""
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from game_loader import CHUNK, GameColumns, dump_columns, dump_files, record_chunks
+from game_records import RESULT_CODES, GameRecordReader
+
+
+MANIFEST = 'manifest.json'
+# Rolling rates over the last window games, NaN until there have been that many
+RATE_COLUMNS = {'black_rate': RESULT_CODES['BLACK'], 'white_rate': RESULT_CODES['WHITE'],
+                'draw_rate': RESULT_CODES['DRAW']}
+COLUMN_DTYPES = {'results': np.int8, 'turns': np.int32, 'pieces_left': np.int8, 'final_black': np.uint32,
+                 'final_white': np.uint32, 'final_kings': np.uint32,
+                 'black_rate': np.float32, 'white_rate': np.float32, 'draw_rate': np.float32}
+
+
+class AnalyticsStore:
+    def __init__(self, directory: str, window: int = 100):
+        """Open the store in directory, creating it with the given rolling window if it doesn't exist."""
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, MANIFEST)
+        if os.path.exists(path):
+            with open(path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'games': 0, 'window': window, 'totals': {name: 0 for name in RESULT_CODES},
+                             'sources': {}}
+        self._trim()
+        if not os.path.exists(path):
+            self._save_manifest()
+
+    def __len__(self):
+        return self.manifest['games']
+
+    @property
+    def window(self):
+        return self.manifest['window']
+
+    @property
+    def totals(self):
+        """Games won by each side and drawn, by result name."""
+        return dict(self.manifest['totals'])
+
+    def _column_path(self, name: str):
+        return os.path.join(self.directory, name + '.bin')
+
+    def _trim(self):
+        # Drop rows an interrupted ingest appended without recording them in the manifest
+        for name, dtype in COLUMN_DTYPES.items():
+            path = self._column_path(name)
+            size = len(self) * np.dtype(dtype).itemsize
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+            if os.path.getsize(path) != size:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+
+    def column(self, name: str):
+        """One column of every game ingested so far, memory-mapped read-only."""
+        if len(self) == 0:
+            return np.zeros(0, dtype=COLUMN_DTYPES[name])
+        return np.memmap(self._column_path(name), dtype=COLUMN_DTYPES[name], mode='r', shape=(len(self),))
+
+    @property
+    def columns(self):
+        return GameColumns(*(self.column(name) for name in GameColumns._fields))
+
+    def _save_manifest(self):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.' + MANIFEST, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, os.path.join(self.directory, MANIFEST))
+
+    def _rates(self, results):
+        """The rolling rate columns for new results, carrying on from the results already stored."""
+        earlier = np.asarray(self.column('results')[max(len(self) - self.window + 1, 0):])
+        combined = np.concatenate([earlier, results])
+        rates = {}
+        for name, code in RATE_COLUMNS.items():
+            totals = np.concatenate([[0], np.cumsum(combined == code)])
+            # Games before the first new one, so positions count from the start of the store
+            ends = np.arange(len(earlier) + 1, len(combined) + 1)
+            rate = (totals[ends] - totals[np.maximum(ends - self.window, 0)]) / float(self.window)
+            rate[len(self) - len(earlier) + ends <= self.window - 1] = np.nan
+            rates[name] = rate.astype(np.float32)
+        return rates
+
+    def _append(self, chunk: GameColumns, source: str, progress):
+        if len(chunk.results) > 0:
+            values = dict(chunk._asdict(), **self._rates(chunk.results))
+            for name, dtype in COLUMN_DTYPES.items():
+                with open(self._column_path(name), 'ab') as f:
+                    f.write(np.asarray(values[name], dtype=dtype).tobytes())
+            self.manifest['games'] += len(chunk.results)
+            for name, code in RESULT_CODES.items():
+                self.manifest['totals'][name] += int((chunk.results == code).sum())
+        self.manifest['sources'][source] = progress
+        self._save_manifest()
+
+    def ingest(self, source: str, chunk_size: int = CHUNK):
+        """Append the games of a record file or dump directory not already in the store; returns how many."""
+        start = len(self)
+        if os.path.isdir(source):
+            for path in dump_files(source):
+                key = os.path.abspath(path)
+                if key not in self.manifest['sources']:
+                    chunk = dump_columns(path)
+                    self._append(chunk, key, {'games': len(chunk.results)})
+        else:
+            key = os.path.abspath(source)
+            done = self.manifest['sources'].get(key, {'games': 0})['games']
+            with GameRecordReader(source) as records:
+                if len(records) < done:
+                    raise ValueError('{} has {} games but {} were already ingested from it'.format(
+                        source, len(records), done))
+            for chunk in record_chunks(source, chunk_size, start=done):
+                done += len(chunk.results)
+                self._append(chunk, key, {'games': done})
+        return len(self) - start
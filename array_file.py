@@ -0,0 +1,80 @@
+"""Binary files of named NumPy arrays behind a small header, read back through mmap.
+
+A file is an 8-byte magic, a 4-byte header length, a JSON header naming the kind of file, its metadata
+and the dtype, shape and offset of each array, then the arrays themselves, each 64-byte aligned.
+Files are written to a temporary file next to the target and moved into place with os.replace, so
+readers see either the old file or the new one, never a half-written one.  Reading maps the arrays
+with np.memmap; nothing is deserialised, and processes opening the same file share its pages.
+"""
+import json
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+
+MAGIC = b'XOARRAYS'
+ALIGNMENT = 64
+
+
+def _align(offset: int):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def save_arrays(path: str, kind: str, arrays: dict, meta: dict = None):
+    """Atomically write arrays (a dict of name -> array) and a JSON-able meta dict to path."""
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    layout = []
+    offset = 0
+    for name, array in arrays.items():
+        layout.append({'name': name, 'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset})
+        offset = _align(offset + array.nbytes)
+    header = json.dumps({'kind': kind, 'meta': meta or {}, 'arrays': layout}).encode('utf-8')
+    data_start = _align(len(MAGIC) + 4 + len(header))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC + struct.pack('<I', len(header)) + header)
+            for entry, array in zip(layout, arrays.values()):
+                f.seek(data_start + entry['offset'])
+                f.write(array.tobytes())
+            f.truncate(data_start + offset)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp makes the file private to its owner
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def load_arrays(path: str, kind: str, mode: str = 'r'):
+    """Return (meta, arrays) from a file written by save_arrays, with each array memory-mapped.
+
+    mode is np.memmap's: 'r' for read-only pages shared between processes, 'c' for private copy-on-write
+    arrays that can be changed in memory without touching the file, 'r+' to write through to the file.
+    """
+    with open(path, 'rb') as f:
+        prefix = f.read(len(MAGIC) + 4)
+        if len(prefix) < len(MAGIC) + 4 or prefix[:len(MAGIC)] != MAGIC:
+            raise ValueError('{} is not an array file'.format(path))
+        header_length, = struct.unpack('<I', prefix[len(MAGIC):])
+        header = json.loads(f.read(header_length).decode('utf-8'))
+    if header['kind'] != kind:
+        raise ValueError('{} holds {}, not {}'.format(path, header['kind'], kind))
+    data_start = _align(len(MAGIC) + 4 + header_length)
+    arrays = {}
+    for entry in header['arrays']:
+        shape = tuple(entry['shape'])
+        if np.prod(shape, dtype=np.int64) == 0:
+            # np.memmap refuses empty arrays
+            arrays[entry['name']] = np.zeros(shape, dtype=np.dtype(entry['dtype']))
+        else:
+            arrays[entry['name']] = np.memmap(path, dtype=np.dtype(entry['dtype']), mode=mode,
+                                              offset=data_start + entry['offset'], shape=shape)
+    return header['meta'], arrays
@@ -0,0 +1,306 @@
+"""Repeatable performance measurements for the engines and AIs.
+
+    python benchmark.py                            # every benchmark, as a table
+    python benchmark.py -k Bitboard -k AlphaBeta   # only benchmarks whose names contain one of these
+    python benchmark.py --json results.json        # also write the results as JSON
+    python benchmark.py --save baseline.json       # keep these results to compare later runs with
+    python benchmark.py --compare baseline.json    # each benchmark's change since a saved run
+    python benchmark.py --ordering                 # node counts with move ordering off and on
+
+Benchmarks run over fixed sets of positions, the same ones every run and for every engine, or play whole
+games with fixed seeds.  The positions are reached by seeded random play (perft.random_moves) rather
+than taken from recorded games: the repo keeps no game records, since games_dump is generated and
+ignored, and a line of moves from a seed replays identically on every engine, so the sets are as fixed
+as a checked-in file would make them.  One call of a benchmark covers its whole set.
+
+Timing follows pytest-benchmark: the number of calls per round is doubled until a round takes at least
+MIN_ROUND_TIME, then each round gives one time per call, and the report has their min, median, mean and
+standard deviation.  A benchmark whose calls change what the next one does, like searches filling their
+tables, is reset before each call outside the timing.  Comparisons use the min, which is the least
+disturbed by whatever else the machine is doing.  Searches also report their node counts, which change
+only if the search does.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from contextlib import redirect_stdout
+from functools import partial
+
+import numpy as np
+
+from AIhub import AlphaBetaAI, RandomAI, StateLearnerAI
+from checkers_bitboard import BitboardCheckers
+from learner_stats import CompactLearnerStats
+from move_ordering import HeuristicOrdering, MoveOrdering
+from perft import ENGINES, random_moves, reach
+from tournament import play_game
+from xsandos import NewellSimonAI, XsAndOs, XsAndOsRunner
+from xsandos_batch import play_batch, random_policy, record_outcomes
+
+
+ROUNDS = 5
+MIN_ROUND_TIME = 0.05
+# A change in a benchmark's min time smaller than this is reported as noise
+THRESHOLD = 0.1
+
+
+def sample_positions(game_class, count: int, plies: int, seed: int):
+    """Positions reached by playing plies random moves from the start, count times."""
+    return [reach(game_class, moves) for moves in random_moves(count, plies, seed)]
+
+
+def xsandos_positions(count: int, seed: int):
+    """Unfinished noughts and crosses games after 0 to 7 random moves."""
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        game = XsAndOs()
+        for _ in range(rng.randrange(8)):
+            if game.check_end_game():
+                break
+            game.make_move(rng.choice(game.possible_moves(game.next_player)))
+        if not game.check_end_game() and game.possible_moves(game.next_player):
+            positions.append(game)
+    return positions
+
+
+def move_ordering_node_counts(game_class=BitboardCheckers, depth=5, num_positions=20, plies=12, seed=0):
+    """Nodes searched and time taken by AlphaBetaAI over the same positions with ordering off and on.
+
+    'off' still searches the transposition table's best move first; it drops the jump, killer and history
+    heuristics.
+    """
+    positions = sample_positions(game_class, num_positions, plies, seed)
+    results = []
+    for name, ordering_class in (('off', MoveOrdering), ('on', HeuristicOrdering)):
+        nodes = 0
+        start = time.perf_counter()
+        for game in positions:
+            side = game.next_player
+            ai = AlphaBetaAI(game, side, side.other_colour, max_depth=depth, move_ordering=ordering_class())
+            random.seed(seed)
+            ai.move()
+            nodes += ai.nodes
+        results.append((name, nodes, time.perf_counter() - start))
+    return results
+
+
+def measure(function, rounds: int = ROUNDS, min_round_time: float = MIN_ROUND_TIME, reset=None):
+    """Time function() as pytest-benchmark does; returns the statistics of the time per call in seconds.
+
+    reset, if given, is called untimed before every call of function.
+    """
+    def round_time(iterations):
+        if reset is None:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                function()
+            return time.perf_counter() - start
+        total = 0.
+        for _ in range(iterations):
+            reset()
+            start = time.perf_counter()
+            function()
+            total += time.perf_counter() - start
+        return total
+
+    iterations = 1
+    while round_time(iterations) < min_round_time:
+        iterations *= 2
+    times = [round_time(iterations) / iterations for _ in range(rounds)]
+    return {'min': min(times), 'max': max(times), 'mean': statistics.mean(times),
+            'median': statistics.median(times), 'stddev': statistics.stdev(times) if rounds > 1 else 0.,
+            'rounds': rounds, 'iterations': iterations}
+
+
+# Each benchmark's setup builds what it needs outside the timing and returns (function to time, extra
+# information to report alongside the times), and a function to reset its state before each call if
+# it needs one
+
+def _possible_moves(game_class):
+    positions = sample_positions(game_class, 20, 12, seed=0)
+    return lambda: [game.possible_moves(game.next_player) for game in positions], {}
+
+
+def _apply_undo(game_class):
+    positions = [(game, game.possible_moves(game.next_player)) for game in sample_positions(game_class, 20, 12, 0)]
+
+    def run():
+        for game, moves in positions:
+            for move in moves:
+                game.undo(game.apply(move))
+    return run, {}
+
+
+def _copy(game_class):
+    positions = sample_positions(game_class, 20, 12, seed=0)
+    return lambda: [game.copy() for game in positions], {}
+
+
+def _copy_make_move(game_class):
+    # make_move adds to the game's history, so each call plays the move in a fresh copy
+    positions = [(game, game.possible_moves(game.next_player)[0]) for game in sample_positions(game_class, 20, 12, 0)]
+
+    def run():
+        for game, move in positions:
+            game.copy().make_move(move)
+    return run, {}
+
+
+def _check_end_game(game_class):
+    positions = sample_positions(game_class, 20, 12, seed=0)
+    return lambda: [game.check_end_game() for game in positions], {}
+
+
+def _xsandos_check_end_game():
+    positions = xsandos_positions(100, seed=0)
+    return lambda: [game.check_end_game() for game in positions], {}
+
+
+def _newell_simon_move():
+    ais = [NewellSimonAI(game, game.next_player, game.next_player.other_side) for game in xsandos_positions(100, 0)]
+    return lambda: [ai.move() for ai in ais], {}
+
+
+def _learner_best_move():
+    # Statistics learnt from the same 10000 seeded random games every run
+    stats = CompactLearnerStats()
+    record_outcomes(play_batch(random_policy, random_policy, 10000, seed=0), stats)
+    StateLearnerAI.use_stats(stats)
+    ais = [StateLearnerAI(game, game.next_player, game.next_player.other_side) for game in xsandos_positions(100, 0)]
+    return lambda: [ai.get_best_historical_move() for ai in ais], {'positions': len(stats)}
+
+
+def _alphabeta_move(depth: int):
+    positions = sample_positions(BitboardCheckers, 10, 12, seed=0)
+    ais = [AlphaBetaAI(game, game.next_player, game.next_player.other_colour, max_depth=depth, seed=0)
+           for game in positions]
+
+    def reset():
+        # Every search starts as a new AI's would, with nothing learnt from the call before
+        for ai in ais:
+            ai.transposition_table.clear()
+            ai.move_ordering = HeuristicOrdering()
+
+    def run():
+        nodes = 0
+        for ai in ais:
+            ai.move()
+            nodes += ai.nodes
+        return nodes
+    reset()
+    return run, {'nodes': run()}, reset
+
+
+def _checkers_games():
+    black = partial(AlphaBetaAI, max_depth=2, seed=0)
+
+    def run():
+        return [len(play_game(black, RandomAI, seed, BitboardCheckers)[2]) for seed in range(4)]
+    return run, {'moves': run()}
+
+
+def _xsandos_games():
+    def run():
+        random.seed(0)
+        # XsAndOsRunner prints every result
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            for _ in range(100):
+                XsAndOsRunner(NewellSimonAI, RandomAI).start_game(verbose=False)
+    return run, {}
+
+
+BENCHMARKS = []
+for _game_class in ENGINES:
+    for _name, _setup in (('possible_moves', _possible_moves), ('apply/undo', _apply_undo), ('copy', _copy),
+                          ('copy+make_move', _copy_make_move), ('check_end_game', _check_end_game)):
+        BENCHMARKS.append(('{}.{}'.format(_game_class.__name__, _name), partial(_setup, _game_class)))
+BENCHMARKS += [
+    ('XsAndOs.check_end_game', _xsandos_check_end_game),
+    ('NewellSimonAI.move', _newell_simon_move),
+    ('StateLearnerAI.get_best_historical_move', _learner_best_move),
+    ('AlphaBetaAI.move depth 2', partial(_alphabeta_move, 2)),
+    ('AlphaBetaAI.move depth 4', partial(_alphabeta_move, 4)),
+    ('checkers games AlphaBetaAI v RandomAI', _checkers_games),
+    ('xsandos games NewellSimonAI v RandomAI', _xsandos_games),
+]
+
+
+def run_benchmarks(names=None, rounds: int = ROUNDS, verbose: bool = True):
+    """Run the benchmarks whose names contain any of names (all of them if None) and return the results."""
+    results = {}
+    for name, setup in BENCHMARKS:
+        if names and not any(part in name for part in names):
+            continue
+        function, extra, *reset = setup()
+        results[name] = dict(measure(function, rounds, reset=reset[0] if reset else None), extra=extra)
+        if verbose:
+            print(format_result(name, results[name]))
+    return {'datetime': datetime.datetime.now().isoformat(),
+            'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'numpy': np.__version__},
+            'benchmarks': results}
+
+
+def format_result(name: str, result: dict):
+    return '{:<42} min {:10.3f}ms  median {:10.3f}ms  mean {:10.3f}ms  stddev {:8.3f}ms  {}'.format(
+        name, 1000 * result['min'], 1000 * result['median'], 1000 * result['mean'], 1000 * result['stddev'],
+        ' '.join('{} {}'.format(key, value) for key, value in result['extra'].items()))
+
+
+def compare(results: dict, baseline: dict, threshold: float = THRESHOLD):
+    """Print each benchmark's change in min time from baseline; returns the names that got slower."""
+    slower = []
+    for name, result in results['benchmarks'].items():
+        old = baseline['benchmarks'].get(name)
+        if old is None:
+            print('{:<42} new'.format(name))
+            continue
+        change = result['min'] / old['min'] - 1
+        verdict = 'slower' if change > threshold else 'faster' if change < -threshold else ''
+        if verdict == 'slower':
+            slower.append(name)
+        changed_extra = '' if result['extra'] == old['extra'] else '  extra changed from {}'.format(old['extra'])
+        print('{:<42} {:10.3f}ms -> {:10.3f}ms {:+7.1%} {:6}{}'.format(
+            name, 1000 * old['min'], 1000 * result['min'], change, verdict, changed_extra))
+    return slower
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the engines and AIs.')
+    parser.add_argument('-k', dest='names', action='append', help='only benchmarks whose names contain this')
+    parser.add_argument('--rounds', type=int, default=ROUNDS)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--save', help='write the results to this file as a baseline')
+    parser.add_argument('--compare', help='compare with a baseline written by --save')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='fraction of change in min time to report as slower or faster')
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help='exit with status 1 if any benchmark is slower than the baseline')
+    parser.add_argument('--ordering', action='store_true', help='compare node counts with move ordering off and on')
+    args = parser.parse_args()
+
+    if args.ordering:
+        print('Move ordering, depth 5 over 20 positions')
+        for name, nodes, seconds in move_ordering_node_counts():
+            print('{:>4}: {:9d} nodes {:8.2f}s'.format(name, nodes, seconds))
+        sys.exit()
+
+    results = run_benchmarks(args.names, args.rounds)
+    for path in (args.json, args.save):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print('\nCompared with {} from {}'.format(args.compare, baseline['datetime']))
+        slower = compare(results, baseline, args.threshold)
+        if slower and args.fail_on_regression:
+            sys.exit(1)
@@ -1,6 +1,6 @@
 from game import Game, GameRunner
+from zobrist import ZobristKeys, swap_halves
 from enum import Enum
-from copy import deepcopy
 
 
 def colored(r, g, b, text):
@@ -14,11 +14,6 @@ def sum_l(lister):
     return ans[2:]
 
 
-class MoveCheckers(Enum):
-    PIECE = 1
-    DIRECTION = 2
-
-
 class Result(Enum):
     WHITE = 1
     BLACK = 2
@@ -26,7 +21,7 @@ class Result(Enum):
 
     @property
     def to_colour(self):
-        return Colour.BLACK if self.value == Result.BLACK else Colour.WHITE
+        return Colour.BLACK if self == Result.BLACK else Colour.WHITE
 
 
 class MoveType(Enum):
@@ -41,11 +36,11 @@ class Colour(Enum):
 
     @property
     def other_colour(self):
-        return Colour.BLACK if self.value == Colour.WHITE else Colour.WHITE
+        return Colour.BLACK if self == Colour.WHITE else Colour.WHITE
 
     @property
     def to_result(self):
-        return Result.BLACK if self.value == Colour.BLACK else Result.WHITE
+        return Result.BLACK if self == Colour.BLACK else Result.WHITE
     
 
 class Direction(Enum):
@@ -55,6 +50,82 @@ class Direction(Enum):
     DOWN_LEFT = 4  # [1, -1]
 
 
+# Keyed by (colour, is king) and the square's index 8 * row + column.  Shared with BitboardCheckers
+# so both engines give the same key for the same position.  Turning the board round and swapping the
+# colours gives an equivalent position, and swap_halves maps each key to that position's key.
+CHECKERS_ZOBRIST = ZobristKeys(64, [(Colour.BLACK, False), (Colour.BLACK, True), (Colour.WHITE, False), (Colour.WHITE, True)],
+                               [Colour.BLACK, Colour.WHITE], seed=8,
+                               flip=([63 - square for square in range(64)],
+                                     {(colour, king): (colour.other_colour, king)
+                                      for colour in (Colour.BLACK, Colour.WHITE) for king in (False, True)},
+                                     {Colour.BLACK: Colour.WHITE, Colour.WHITE: Colour.BLACK}))
+
+
+def state_key(position_key: int, side: Colour):
+    """The key of a position as side sees it: the position itself for black, the flipped one for white."""
+    return position_key if side == Colour.BLACK else swap_halves(position_key)
+
+
+class CheckersMove:
+    """A single step or jump by one piece, given by board co-ordinates rather than a live Piece.
+
+    Squares are (row, column) tuples.  A multi-jump is played as a run of jumps by the same piece, so
+    captured holds at most one square.  Moves are immutable and hashable, so they can be shared between
+    copies of a game and used as dict keys.
+    """
+    __slots__ = ('_start', '_end', '_captured', '_promotes', '_hash')
+
+    def __init__(self, start: tuple, end: tuple, captured: tuple = (), promotes: bool = False):
+        self._start = start
+        self._end = end
+        self._captured = captured
+        self._promotes = promotes
+        # Moves are looked up in history tables and killer lists at every node, so hash once
+        self._hash = hash(self._key())
+
+    @property
+    def start(self):
+        return self._start
+
+    @property
+    def end(self):
+        return self._end
+
+    @property
+    def captured(self):
+        return self._captured
+
+    @property
+    def promotes(self):
+        return self._promotes
+
+    @property
+    def is_jump(self):
+        return abs(self._end[0] - self._start[0]) == 2
+
+    @property
+    def direction(self):
+        d_row = self._end[0] - self._start[0]
+        d_col = self._end[1] - self._start[1]
+        if abs(d_row) != abs(d_col) or abs(d_row) not in (1, 2):
+            return None
+        if d_row < 0:
+            return Direction.UP_RIGHT if d_col > 0 else Direction.UP_LEFT
+        return Direction.DOWN_RIGHT if d_col > 0 else Direction.DOWN_LEFT
+
+    def _key(self):
+        return self._start, self._end, self._captured, self._promotes
+
+    def __eq__(self, other):
+        return isinstance(other, CheckersMove) and self._key() == other._key()
+
+    def __hash__(self):
+        return self._hash
+
+    def __repr__(self):
+        return 'CheckersMove({}, {}, captured={}, promotes={})'.format(*self._key())
+
+
 class Piece:
     def __init__(self, colour: Colour, position: list):
         self._colour = colour
@@ -104,8 +175,16 @@ class Piece:
     def remove_piece(self):
         self._position = [-1, -1]
 
+    def restore(self, position: list, king: bool, direction: list):
+        # Used by Checkers.undo to put a piece back exactly as it was
+        self._position = position
+        self._king = king
+        self._direction = direction
+
 
 class Checkers(Game):
+    zobrist = CHECKERS_ZOBRIST
+
     def __init__(self, board=None):
         super().__init__()
         if board:
@@ -130,9 +209,29 @@ class Checkers(Game):
             for j in range(8):
                 if self._board[i][j] != Colour.BLANK:
                     self._pieces[self._board[i][j]].append(Piece(self._board[i][j], [i, j]))
+        self._index_pieces()
+        self._position_key = self._compute_position_key()
         self.game_history = []
+        self.key_history = []
+        self.move_history = []
         self.add_state_to_game_history()
 
+    def _index_pieces(self):
+        # Square to piece lookup for the live pieces, kept in step with the board by apply and undo
+        self._piece_at = {}
+        for colour in self._pieces:
+            for piece in self._pieces[colour]:
+                if not piece.is_dead:
+                    self._piece_at[tuple(piece.position)] = piece
+
+    def _compute_position_key(self):
+        key = self.zobrist.side_to_move[self._next_player] if self._next_player else 0
+        for square, piece in self._piece_at.items():
+            key ^= self.zobrist.pieces[(piece.colour, piece.king)][8 * square[0] + square[1]]
+        if self._piece_to_move:
+            key ^= self.zobrist.pending_jump[8 * self._piece_to_move.position[0] + self._piece_to_move.position[1]]
+        return key
+
     @property
     def turn_count(self):
         return self._turn_count
@@ -141,6 +240,25 @@ class Checkers(Game):
     def piece_to_move(self):
         return self._piece_to_move
 
+    def canonical_key(self, side: Colour):
+        return state_key(self._position_key, side)
+
+    def canonical_history(self, side: Colour):
+        return [state_key(key, side) for key in self.key_history]
+
+    def to_bitboards(self):
+        """(black, white, kings) as BitboardCheckers holds them, one bit per playable square row * 4 + column // 2."""
+        black, white, kings = 0, 0, 0
+        for (row, col), piece in self._piece_at.items():
+            bit = 1 << (4 * row + col // 2)
+            if piece.colour == Colour.BLACK:
+                black |= bit
+            else:
+                white |= bit
+            if piece.king:
+                kings |= bit
+        return black, white, kings
+
     def copy(self, include_history=True):
         game_copy = Checkers()
         for i in range(len(game_copy._board)):
@@ -153,36 +271,60 @@ class Checkers(Game):
         game_copy._pieces = {}
         for key in self._pieces:
             game_copy._pieces[key] = [p.copy() for p in self._pieces[key]]
+        game_copy._index_pieces()
+        if self._piece_to_move:
+            game_copy._piece_to_move = game_copy._piece_at[tuple(self._piece_to_move.position)]
+        game_copy._position_key = self._position_key
 
         game_copy.game_history = []
+        game_copy.key_history = []
+        game_copy.move_history = []
         if include_history:
-            game_copy.game_history = deepcopy(self.game_history)
+            game_copy.game_history = self.game_history[:]
+            game_copy.key_history = self.key_history[:]
+            game_copy.move_history = self.move_history[:]
         return game_copy
             
-    def possible_moves(self, side: Colour):
+    def possible_moves(self, side: Colour, **kwargs):
+        # CheckersRunner's must_jump/ind_piece hints are already implied by the game state
         possible_moves = []
         for piece in self._pieces[side]:
             if self._piece_to_move:
                 if self._piece_to_move.position != piece.position:
                     continue
+            if piece.is_dead:
+                continue
+            start = tuple(piece.position)
             for direction in Direction:
-                if self.check_move({MoveCheckers.PIECE: piece, MoveCheckers.DIRECTION: direction})[0]:
-                    possible_moves.append({MoveCheckers.PIECE: piece, MoveCheckers.DIRECTION: direction})
+                new_square = self.adj_square(piece.position, direction)
+                if self._board_value(new_square) == piece.other_colour:
+                    end = tuple(self.adj_square(new_square, direction))
+                    move = CheckersMove(start, end, (tuple(new_square),), not piece.king and end[0] in [0, 7])
+                else:
+                    end = tuple(new_square)
+                    move = CheckersMove(start, end, (), not piece.king and end[0] in [0, 7])
+                if self.check_move(move)[0]:
+                    possible_moves.append(move)
         return possible_moves
 
+    def _board_value(self, square: list):
+        if min(square) < 0 or max(square) > 7:
+            return None
+        return self._board[square[0]][square[1]]
+
     def add_state_to_game_history(self):
+        if self.key_history and self.key_history[-1] == self._position_key:
+            # In the case of multiple jumps, we end up with multiple copies
+            # of the board. Prune these here.
+            return
         board_list = []
         for i in range(8):
             for j in range(8):
                 position_char = 'B' if self._board[i][j] == Colour.BLACK else \
                     'W' if self._board[i][j] == Colour.WHITE else ' '
                 board_list.append(position_char)
-        board_string = ''.join(board_list)
-        if self.game_history and self.game_history[-1] == board_string:
-            # In the case of multiple jumps, we end up with multiple copies
-            # of the board. Prune these here.
-            return
-        self.game_history.append(board_string)
+        self.game_history.append(''.join(board_list))
+        self.key_history.append(self._position_key)
 
     def print_board(self):
         for i in range(8):
@@ -200,32 +342,38 @@ class Checkers(Game):
     def pieces(self):
         return self._pieces
 
-    def check_move(self, move):
-        # TODO: Double check that the right colour is being picked
-        # print("AAAAAAAAAAAAAAAA")
-        # print(move)
-        piece = move[MoveCheckers.PIECE]
-        direction = move[MoveCheckers.DIRECTION]
+    def material(self, colour: Colour):
+        """(men, kings) that colour has left on the board."""
+        men, kings = 0, 0
+        for piece in self._pieces[colour]:
+            if not piece.is_dead:
+                if piece.king:
+                    kings += 1
+                else:
+                    men += 1
+        return men, kings
+
+    def check_move(self, move: CheckersMove):
+        piece = self._piece_at.get(move.start)
+        # No live piece on the starting square
+        if piece is None:
+            return False, None
         # Check if double jump required
-        if self._piece_to_move:
-            if self._piece_to_move.position != piece.position:
-                return False, None
-        # Piece already taken
-        if piece.position == [-1, -1]:
+        if self._piece_to_move and self._piece_to_move is not piece:
             return False, None
-        # Piece moving backwards illegally
+        direction = move.direction
+        # Piece moving backwards illegally, or not moving diagonally at all
         if direction not in piece.direction:
             return False, None
         new_square = self.adj_square(piece.position, direction)
         # new square off the board
         if min(new_square) < 0 or max(new_square) > 7:
             return False, None
-        # Can't move through square with own piece
-        if self._board[new_square[0]][new_square[1]] == piece.colour:
-            return False, None
-        # Other colour, potential jump
-        if self._board[new_square[0]][new_square[1]] == piece.other_colour:
-            jump_square = self.adj_square(new_square, direction)
+        if move.is_jump:
+            # Can only jump over the other colour
+            if self._board[new_square[0]][new_square[1]] != piece.other_colour:
+                return False, None
+            jump_square = move.end
             # can't jump off the board
             if min(jump_square) < 0 or max(jump_square) > 7:
                 return False, None
@@ -233,24 +381,39 @@ class Checkers(Game):
             if self._board[jump_square[0]][jump_square[1]] != Colour.BLANK:
                 return False, None
             return True, MoveType.JUMP
+        # Can't move onto a square with any piece
+        if self._board[new_square[0]][new_square[1]] != Colour.BLANK:
+            return False, None
         # Player must make a jump if required
         if self.check_jump_required(piece.colour):
             return False, None
         return True, MoveType.MOVE
 
     def make_move(self, move):
-        # TODO: My god this hack is something horrific, this ensures that the piece selected is in this version of the
-        # game.  Maybe the move should just include co-ordinates and not the piece object?
-        piece = move[MoveCheckers.PIECE]
-        for meeple in self._pieces[Colour.WHITE] + self._pieces[Colour.BLACK]:
-            if meeple.position == piece.position:
-                piece = meeple
-
-        direction = move[MoveCheckers.DIRECTION]
-        allowed, m_type = self.check_move(move)
-        if not allowed:
+        if self.apply(move) is None:
             return False
+        self.move_history.append(move)
+        self.add_state_to_game_history()
+        return True
 
+    def apply(self, move):
+        """Make move in place without recording it in the game history.
+
+        Returns a token that undo() takes to restore the exact previous state, or None if the move is not allowed.
+        """
+        allowed, m_type = self.check_move(move)
+        if not allowed:
+            return None
+        piece = self._piece_at.pop(move.start)
+        direction = move.direction
+
+        undo_token = (piece, piece.position, piece.king, piece.direction, self._next_player, self._turn_count,
+                      self.turns_since_last_piece_taken, self._piece_to_move, self._position_key)
+        keys = self.zobrist
+        key = self._position_key ^ keys.pieces[(piece.colour, piece.king)][8 * move.start[0] + move.start[1]]
+        if self._piece_to_move:
+            key ^= keys.pending_jump[8 * move.start[0] + move.start[1]]
+        taken = None
         if m_type == MoveType.MOVE:
             self.turns_since_last_piece_taken += 1
             self._board[piece.position[0]][piece.position[1]] = Colour.BLANK
@@ -258,15 +421,16 @@ class Checkers(Game):
             self._board[piece.position[0]][piece.position[1]] = piece.colour
             if piece.position[0] in [0, 7]:
                 piece.king_piece()
-        elif m_type == MoveType.JUMP:
+        else:
             self.turns_since_last_piece_taken = 0
             new_square = self.adj_square(piece.position, direction)
             self._board[piece.position[0]][piece.position[1]] = Colour.BLANK
             self._board[new_square[0]][new_square[1]] = Colour.BLANK
 
-            for piece_taken in self._pieces[piece.other_colour]:
-                if piece_taken.position == new_square:
-                    piece_taken.remove_piece()
+            piece_taken = self._piece_at.pop(tuple(new_square))
+            taken = (piece_taken, piece_taken.position)
+            key ^= keys.pieces[(piece_taken.colour, piece_taken.king)][8 * new_square[0] + new_square[1]]
+            piece_taken.remove_piece()
             piece.move(direction)
             piece.move(direction)
             self._board[piece.position[0]][piece.position[1]] = piece.colour
@@ -276,30 +440,36 @@ class Checkers(Game):
             if piece.position[0] in [0, 7]:
                 piece.king_piece()
             # TODO: Can a piece jump to the last line and immediately jump backwards???
-        else:
-            # raise NotImplementedError("Unknown move type {}".format(m_type))
-            print('Unknown move type {}'.format(m_type))
-            return False
-            
+        self._piece_at[tuple(piece.position)] = piece
+        end_index = 8 * piece.position[0] + piece.position[1]
+        key ^= keys.pieces[(piece.colour, piece.king)][end_index]
+
         if m_type == MoveType.MOVE or not self.check_piece_can_take(piece):
             self._turn_count += 1
+            key ^= keys.side_to_move[self._next_player]
             self._next_player = Colour.WHITE if self._next_player == Colour.BLACK else Colour.BLACK
+            key ^= keys.side_to_move[self._next_player]
             self._piece_to_move = None
-            # valid_move = False
-            # while not valid_move:
-            #    move = self._ais[piece.colour].move(must_jump=True, ind_piece=piece)
-            #    print(self._ais[piece.colour].id_val)
-            #    print("")
-            #    print(move)
-            #    print(move[MoveCheckers.PIECE].position)
-            #    print([pi.position for pi in self._pieces[self._turn]])
-            #    valid_move = self.check_move(move)
-            #    print(valid_move)
-            # self.make_move(move)
         else:
+            key ^= keys.pending_jump[end_index]
             self._piece_to_move = piece
-        self.add_state_to_game_history()
-        return True
+        self._position_key = key
+        return undo_token + (taken,)
+
+    def undo(self, undo_token):
+        """Reverse a move made by apply(), given the token it returned."""
+        (piece, position, king, direction, self._next_player, self._turn_count,
+         self.turns_since_last_piece_taken, self._piece_to_move, self._position_key, taken) = undo_token
+        self._board[piece.position[0]][piece.position[1]] = Colour.BLANK
+        del self._piece_at[tuple(piece.position)]
+        piece.restore(position, king, direction)
+        self._board[position[0]][position[1]] = piece.colour
+        self._piece_at[tuple(position)] = piece
+        if taken is not None:
+            piece_taken, taken_position = taken
+            piece_taken.restore(taken_position, piece_taken.king, piece_taken.direction)
+            self._board[taken_position[0]][taken_position[1]] = piece_taken.colour
+            self._piece_at[tuple(taken_position)] = piece_taken
 
     def check_piece_can_take(self, piece: Piece):
         # Check 4 directions
@@ -354,27 +524,36 @@ class Checkers(Game):
                     continue
                 if self._board[new_square[0]][new_square[1]] == Colour.BLANK:
                     return False
-        return colour.to_result
+        # The side left without a move loses
+        return colour.other_colour.to_result
 
 
 class CheckersRunner(GameRunner):
-    def __init__(self, Black_AIClass=None, White_AIClass=None):
+    def __init__(self, Black_AIClass=None, White_AIClass=None, game_class=None):
         super().__init__()
-        self._game = Checkers()
+        # Any engine implementing the Checkers interface can be dropped in here, e.g. BitboardCheckers
+        self._game = (game_class or Checkers)()
         self._ais = {
             Colour.BLACK: Black_AIClass(self._game, Colour.BLACK, Colour.WHITE),
             Colour.WHITE: White_AIClass(self._game, Colour.WHITE, Colour.BLACK),
         }
-        
+        # Can be switched at any time; AIs with collect_stats (AlphaBetaAI) then leave a record of each search
+        self.record_search = False
+        self.search_records = []
+
     def start_game(self, verbose=False):
         while True:
             valid_move = False
             move = None
             while not valid_move:
                 next_ai = self._ais[self._game.next_player]
+                if hasattr(next_ai, 'collect_stats'):
+                    next_ai.collect_stats = self.record_search
                 move = next_ai.move(must_jump=self._game.check_jump_required(Colour.BLACK),
                                     ind_piece=self._game.piece_to_move)  # TODO: arg
                 valid_move, style = self._game.check_move(move)
+            if self.record_search and getattr(next_ai, 'last_search', None):
+                self.search_records.append(next_ai.last_search)
             self._game.make_move(move)
             if verbose or self._game.turn_count > 1000:
                 print("")
@@ -400,3 +579,24 @@ class CheckersRunner(GameRunner):
 
     def game_history(self):
         return self._game.game_history
+
+    def move_history(self):
+        return self._game.move_history
+
+    def search_report(self):
+        """The recorded searches of the game, and totals for each side, as plain dicts and lists."""
+        totals = {}
+        for record in self.search_records:
+            side = totals.setdefault(record.side, {'moves': 0, 'searched': 0, 'nodes': 0, 'leaf_evaluations': 0,
+                                                   'cutoffs': 0, 'table_cutoffs': 0, 'copies': 0, 'seconds': 0.})
+            side['moves'] += 1
+            side['searched'] += record.source == 'search'
+            side['nodes'] += record.nodes
+            side['leaf_evaluations'] += record.leaf_evaluations
+            side['cutoffs'] += sum(record.cutoffs)
+            side['table_cutoffs'] += record.table_cutoffs
+            side['copies'] += record.copies
+            side['seconds'] += record.seconds
+        for side in totals.values():
+            side['nodes_per_second'] = side['nodes'] / side['seconds'] if side['seconds'] else None
+        return {'totals': totals, 'moves': [record._asdict() for record in self.search_records]}
@@ -0,0 +1,252 @@
+"""Many games of checkers played in lockstep on NumPy bitboards, for fast random or greedy playouts.
+
+Each game is three uint32 bitboards (black, white, kings) over the 32 playable squares numbered as in
+checkers_bitboard.  Every call to BitboardBatch.play makes one hop in every unfinished game: a step, or
+one jump of a possibly longer multi-jump, after which the same side moves again if the piece can carry on
+jumping.  Jumps are compulsory, and games end as BitboardCheckers.check_end_game says.
+
+    batch = play_batch(random_policy, greedy_policy, 10000, seed=0)
+    batch.history   # (K, plies + 1, 3) uint32 (black, white, kings) after each hop, from the start
+"""
+import numpy as np
+
+from checkers import Colour, Direction
+from checkers_bitboard import (DIRECTION_OFFSET, MAN_DIRECTIONS, OPPOSITE_DIRECTION, POSITION_TO_SQUARE, PROMOTION_ROWS,
+                               SQUARE_TO_POSITION, STEPS)
+
+
+BLACK = 1
+WHITE = -1
+
+DIRECTIONS = list(Direction)
+OPPOSITE = [DIRECTIONS.index(OPPOSITE_DIRECTION[direction]) for direction in DIRECTIONS]
+# MOVES_FORWARD[side][d] is whether a man of that side may move in direction d
+MOVES_FORWARD = {side: np.array([direction in MAN_DIRECTIONS[colour] for direction in DIRECTIONS])
+                 for side, colour in ((BLACK, Colour.BLACK), (WHITE, Colour.WHITE))}
+
+# NEIGHBOUR[d, s] is the square one diagonal step from s in direction d, or -1 off the board
+NEIGHBOUR = np.array([[POSITION_TO_SQUARE.get((row + DIRECTION_OFFSET[direction][0],
+                                               col + DIRECTION_OFFSET[direction][1]), -1)
+                       for row, col in SQUARE_TO_POSITION] for direction in DIRECTIONS], dtype=np.int64)
+
+BIT = np.uint32(1) << np.arange(32, dtype=np.uint32)
+FULL_BOARD = np.uint32(0xFFFFFFFF)
+STEP_MASKS = [[(np.uint32(abs(shift)), shift > 0, np.uint32(mask)) for shift, mask in STEPS[direction]]
+              for direction in DIRECTIONS]
+
+
+def step(bits, d: int):
+    """checkers_bitboard.step over an array of bitboards, for direction index d."""
+    result = np.zeros_like(bits)
+    for shift, left, mask in STEP_MASKS[d]:
+        result |= ((bits & mask) << shift) if left else ((bits & mask) >> shift)
+    return result
+
+
+def unpack(bits):
+    """(K,) bitboards to a (K, 32) bool array of their squares."""
+    return (bits[:, None] & BIT) != 0
+
+
+def count(bits):
+    return unpack(bits).sum(axis=1)
+
+
+class BitboardBatch:
+    """K games of checkers and how each one went.
+
+    sides holds 1 where black is to move and -1 for white; pending is the square of a piece part way
+    through a multi-jump, or -1.  results holds 1 for a black win, -1 for white and 0 for a draw or an
+    unfinished game.  history and moves are filled in by play(): moves[k, ply] is 4 * square + direction
+    index of each hop, -1 once game k is over, and lengths[k] the number of hops it took.
+    """
+    def __init__(self, num_games: int):
+        self.black = np.full(num_games, 0xFFF00000, dtype=np.uint32)
+        self.white = np.full(num_games, 0x00000FFF, dtype=np.uint32)
+        self.kings = np.zeros(num_games, dtype=np.uint32)
+        self.sides = np.full(num_games, BLACK, dtype=np.int8)
+        self.pending = np.full(num_games, -1, dtype=np.int64)
+        self.turn_count = np.zeros(num_games, dtype=np.int64)
+        self.turns_since_last_piece_taken = np.zeros(num_games, dtype=np.int64)
+        self.results = np.zeros(num_games, dtype=np.int8)
+        self.done = np.zeros(num_games, dtype=bool)
+        self.lengths = np.zeros(num_games, dtype=np.int64)
+        self._history = [np.stack([self.black, self.white, self.kings], axis=1)]
+        self._moves = []
+        self._legal = None
+
+    @classmethod
+    def from_positions(cls, black, white, kings, sides, pending=None):
+        """A batch starting from the given positions rather than the opening one."""
+        batch = cls(len(black))
+        batch.black = np.asarray(black, dtype=np.uint32).copy()
+        batch.white = np.asarray(white, dtype=np.uint32).copy()
+        batch.kings = np.asarray(kings, dtype=np.uint32).copy()
+        batch.sides = np.asarray(sides, dtype=np.int8).copy()
+        if pending is not None:
+            batch.pending = np.asarray(pending, dtype=np.int64).copy()
+        batch._history = [np.stack([batch.black, batch.white, batch.kings], axis=1)]
+        return batch
+
+    def __len__(self):
+        return len(self.black)
+
+    @property
+    def history(self):
+        return np.stack(self._history, axis=1)
+
+    @property
+    def moves(self):
+        if not self._moves:
+            return np.zeros((len(self), 0), dtype=np.int8)
+        return np.stack(self._moves, axis=1)
+
+    def _own_other(self):
+        is_black = self.sides == BLACK
+        return np.where(is_black, self.black, self.white), np.where(is_black, self.white, self.black)
+
+    def _moving(self, own, d: int):
+        """Pieces of the side to move that may move in direction d."""
+        forward = np.where(self.sides == BLACK, MOVES_FORWARD[BLACK][d], MOVES_FORWARD[WHITE][d])
+        return np.where(forward, own, own & self.kings)
+
+    def legal_moves(self):
+        """(K, 32, 4) mask of the hops each unfinished game may make, by source square and direction.
+
+        Only jumps are legal in a game with a jump available, and only the pending piece's during a multi-jump.
+        Also returns which games must jump.
+        """
+        if self._legal is not None:
+            return self._legal
+        own, other = self._own_other()
+        empty = ~(own | other) & FULL_BOARD
+        steps = np.zeros((len(self), 32, 4), dtype=bool)
+        jumps = np.zeros((len(self), 32, 4), dtype=bool)
+        for d in range(4):
+            back = OPPOSITE[d]
+            moving = self._moving(own, d)
+            steps[:, :, d] = unpack(moving & step(empty, back))
+            jumps[:, :, d] = unpack(moving & step(step(empty, back) & other, back))
+        jumping = jumps.any(axis=(1, 2))
+        legal = np.where(jumping[:, None, None], jumps, steps)
+        pending = self.pending >= 0
+        if pending.any():
+            only = np.zeros((len(self), 32), dtype=bool)
+            only[pending, self.pending[pending]] = True
+            legal[pending] &= only[pending][:, :, None]
+        legal[self.done] = False
+        self._legal = legal, jumping
+        return self._legal
+
+    def play(self, sources, directions):
+        """Make the hop sources[k] in directions[k] (a direction index) in every unfinished game k."""
+        active = ~self.done
+        sources = np.asarray(sources, dtype=np.int64)
+        directions = np.asarray(directions, dtype=np.int64)
+        middle = NEIGHBOUR[directions, sources]
+        _, other = self._own_other()
+        # A hop onto an enemy piece is a jump over it
+        jumping = active & (middle >= 0) & ((other & BIT[np.maximum(middle, 0)]) != 0)
+        ends = np.where(jumping, NEIGHBOUR[directions, np.maximum(middle, 0)], middle)
+        start_bits = np.where(active, BIT[sources], np.uint32(0))
+        middle_bits = np.where(active & jumping, BIT[np.maximum(middle, 0)], np.uint32(0))
+        end_bits = np.where(active, BIT[np.maximum(ends, 0)], np.uint32(0))
+        is_black = self.sides == BLACK
+
+        # Take the jumped piece, move the mover and carry its crown, then crown anything on the back rows
+        self.black &= ~np.where(is_black, np.uint32(0), middle_bits)
+        self.white &= ~np.where(is_black, middle_bits, np.uint32(0))
+        self.kings &= ~middle_bits
+        self.black ^= np.where(is_black, start_bits | end_bits, np.uint32(0))
+        self.white ^= np.where(is_black, np.uint32(0), start_bits | end_bits)
+        was_king = (self.kings & start_bits) != 0
+        self.kings ^= np.where(was_king, start_bits | end_bits, np.uint32(0))
+        self.kings |= end_bits & np.uint32(PROMOTION_ROWS)
+
+        self.turns_since_last_piece_taken = np.where(jumping, 0, self.turns_since_last_piece_taken + active)
+        # After a jump the same piece carries on if it can take again, kings looking every way
+        own, other = self._own_other()
+        empty = ~(own | other) & FULL_BOARD
+        is_king = (self.kings & end_bits) != 0
+        can_take = np.zeros(len(self), dtype=bool)
+        for d in range(4):
+            forward = np.where(is_black, MOVES_FORWARD[BLACK][d], MOVES_FORWARD[WHITE][d])
+            can_take |= (forward | is_king) & (step(step(end_bits, d) & other, d) & empty != 0)
+        carry_on = active & jumping & can_take
+        switch = active & ~carry_on
+        self.pending = np.where(carry_on, ends, -1)
+        self.turn_count += switch
+        self.sides = np.where(switch, -self.sides, self.sides).astype(np.int8)
+
+        self._moves.append(np.where(active, 4 * sources + directions, -1).astype(np.int8))
+        self.lengths += active
+        self._history.append(np.stack([self.black, self.white, self.kings], axis=1))
+        self._legal = None
+        self._settle(active)
+
+    def _settle(self, active):
+        # BitboardCheckers.check_end_game for every game that just moved
+        black_count = count(self.black)
+        white_count = count(self.white)
+        long_game = active & (self.turn_count > 100)
+        self.results[long_game] = np.sign(black_count - white_count)[long_game]
+        no_capture_draw = active & ~long_game & (self.turns_since_last_piece_taken >= 100)
+        legal, _ = self.legal_moves()
+        stuck = active & ~long_game & ~no_capture_draw & ~legal.any(axis=(1, 2))
+        # The side left without a move loses
+        self.results[stuck] = -self.sides[stuck]
+        self.done |= long_game | no_capture_draw | stuck
+
+
+def random_policy(batch: BitboardBatch, legal, rng: np.random.Generator):
+    """A uniformly random legal hop per game, as (sources, directions)."""
+    scores = np.where(legal, rng.random(legal.shape), -1.).reshape(len(batch), -1)
+    choice = scores.argmax(axis=1)
+    return choice // 4, choice % 4
+
+
+def greedy_policy(batch: BitboardBatch, legal, rng: np.random.Generator):
+    """Crown a piece if possible, otherwise step where the piece cannot be jumped straight back, else at random.
+
+    Jumps are compulsory anyway, so taking is already greedy; this only steers the quiet moves, and picks
+    jumps at random.
+    """
+    own, other = batch._own_other()
+    empty = ~(own | other) & FULL_BOARD
+    crowns = np.zeros(legal.shape, dtype=bool)
+    unsafe = np.zeros(legal.shape, dtype=bool)
+    sides = batch.sides
+    for d in range(4):
+        sources = batch._moving(own, d)
+        landings = step(sources, d)
+        crowns[:, :, d] = unpack(step(landings & np.uint32(PROMOTION_ROWS), OPPOSITE[d]) & ~batch.kings)
+        attacked = np.zeros_like(landings)
+        for e in range(4):
+            # An enemy piece moving in direction e jumps the landing square if the square beyond it is
+            # empty, counting the square the piece just left
+            forward = np.where(sides == BLACK, MOVES_FORWARD[WHITE][e], MOVES_FORWARD[BLACK][e])
+            attackers = np.where(forward, other, other & batch.kings)
+            beyond_empty = empty | sources if e == OPPOSITE[d] else empty
+            attacked |= landings & step(attackers, e) & step(beyond_empty, OPPOSITE[e])
+        unsafe[:, :, d] = unpack(step(attacked, OPPOSITE[d]) & sources)
+    _, jumping = batch.legal_moves()
+    scores = np.where(jumping[:, None, None], 0., 2. * crowns + 1. * ~unsafe) + rng.random(legal.shape)
+    scores = np.where(legal, scores, -1.).reshape(len(batch), -1)
+    choice = scores.argmax(axis=1)
+    return choice // 4, choice % 4
+
+
+def play_batch(black_policy, white_policy, num_games: int, seed: int = None):
+    """Play num_games games to the end, each policy choosing hops for the games where its side is to move."""
+    rng = np.random.default_rng(seed)
+    batch = BitboardBatch(num_games)
+    while not batch.done.all():
+        legal, _ = batch.legal_moves()
+        sources, directions = black_policy(batch, legal, rng)
+        if white_policy is not black_policy:
+            white_sources, white_directions = white_policy(batch, legal, rng)
+            white = batch.sides == WHITE
+            sources = np.where(white, white_sources, sources)
+            directions = np.where(white, white_directions, directions)
+        batch.play(sources, directions)
+    return batch
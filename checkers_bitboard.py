@@ -0,0 +1,400 @@
+from game import Game
+from checkers import (CHECKERS_ZOBRIST, CheckersMove, Colour, Direction, MoveType, Piece, Result, colored, state_key,
+                      sum_l)
+
+
+# The 32 playable squares are numbered row by row, four to a row, so square s sits on
+# row s // 4.  Even rows use the odd columns and odd rows use the even columns.
+SQUARE_TO_POSITION = tuple((s // 4, 2 * (s % 4) + (1 if (s // 4) % 2 == 0 else 0)) for s in range(32))
+POSITION_TO_SQUARE = {position: s for s, position in enumerate(SQUARE_TO_POSITION)}
+
+FULL_BOARD = (1 << 32) - 1
+PROMOTION_ROWS = 0xF000000F  # rows 0 and 7
+
+DIRECTION_OFFSET = {
+    Direction.UP_RIGHT: (-1, 1),
+    Direction.UP_LEFT: (-1, -1),
+    Direction.DOWN_RIGHT: (1, 1),
+    Direction.DOWN_LEFT: (1, -1),
+}
+
+OPPOSITE_DIRECTION = {
+    Direction.UP_RIGHT: Direction.DOWN_LEFT,
+    Direction.UP_LEFT: Direction.DOWN_RIGHT,
+    Direction.DOWN_RIGHT: Direction.UP_LEFT,
+    Direction.DOWN_LEFT: Direction.UP_RIGHT,
+}
+
+MAN_DIRECTIONS = {
+    Colour.BLACK: (Direction.UP_RIGHT, Direction.UP_LEFT),
+    Colour.WHITE: (Direction.DOWN_RIGHT, Direction.DOWN_LEFT),
+}
+
+
+def _build_steps():
+    # For every direction, group the source squares by how far their index shifts when stepping
+    # that way.  Squares whose step would leave the board are left out of every mask.
+    steps = {}
+    for direction, (d_row, d_col) in DIRECTION_OFFSET.items():
+        masks = {}
+        for square, (row, col) in enumerate(SQUARE_TO_POSITION):
+            target = POSITION_TO_SQUARE.get((row + d_row, col + d_col))
+            if target is not None:
+                masks[target - square] = masks.get(target - square, 0) | (1 << square)
+        steps[direction] = tuple(sorted(masks.items()))
+    return steps
+
+
+STEPS = _build_steps()
+
+
+def _build_moves(distance: int):
+    # Every step (distance 1) or jump (distance 2) from every square, as a (man, king) pair of
+    # CheckersMove objects that differ only in the promotes flag.  possible_moves hands these out
+    # instead of allocating new moves.
+    moves = {}
+    for direction, (d_row, d_col) in DIRECTION_OFFSET.items():
+        moves[direction] = []
+        for row, col in SQUARE_TO_POSITION:
+            end = (row + distance * d_row, col + distance * d_col)
+            if end not in POSITION_TO_SQUARE:
+                moves[direction].append(None)
+                continue
+            captured = ((row + d_row, col + d_col),) if distance == 2 else ()
+            moves[direction].append((CheckersMove((row, col), end, captured, end[0] in (0, 7)),
+                                     CheckersMove((row, col), end, captured, False)))
+    return moves
+
+
+STEP_MOVES = _build_moves(1)
+JUMP_MOVES = _build_moves(2)
+
+# The Checkers Zobrist keys re-indexed by the 32 playable squares
+PIECE_KEYS = {kind: [keys[8 * row + col] for row, col in SQUARE_TO_POSITION]
+              for kind, keys in CHECKERS_ZOBRIST.pieces.items()}
+PENDING_JUMP_KEYS = [CHECKERS_ZOBRIST.pending_jump[8 * row + col] for row, col in SQUARE_TO_POSITION]
+
+
+def step(bits: int, direction: Direction):
+    """Shift every set square in bits one diagonal step in direction, dropping squares that leave the board."""
+    result = 0
+    for shift, mask in STEPS[direction]:
+        if shift > 0:
+            result |= (bits & mask) << shift
+        else:
+            result |= (bits & mask) >> -shift
+    return result
+
+
+def squares(bits: int):
+    """Yield the indices of the set squares in bits, lowest first."""
+    while bits:
+        low_bit = bits & -bits
+        yield low_bit.bit_length() - 1
+        bits ^= low_bit
+
+
+class BitboardCheckers(Game):
+    """Checkers on 32-square bitboards: one int per side plus a mask of the kings.
+
+    Implements the same interface and rules as checkers.Checkers so it can be handed to
+    CheckersRunner (game_class=BitboardCheckers) and searched by the AIs unchanged.
+    """
+    zobrist = CHECKERS_ZOBRIST
+
+    def __init__(self, board=None):
+        super().__init__()
+        self._black = 0
+        self._white = 0
+        self._kings = 0
+        if board:
+            for s, (row, col) in enumerate(SQUARE_TO_POSITION):
+                if board[8 * row + col] == Colour.BLACK:
+                    self._black |= 1 << s
+                elif board[8 * row + col] == Colour.WHITE:
+                    self._white |= 1 << s
+        else:
+            self._white = 0x00000FFF
+            self._black = 0xFFF00000
+        self._next_player = Colour.BLACK
+        self._turn_count = 0
+        self.turns_since_last_piece_taken = 0
+        self._piece_to_move = None  # square index of a piece that is part way through a multi-jump
+        self._position_key = self._compute_position_key()
+        self.game_history = []
+        self.key_history = []
+        self.move_history = []
+        self.add_state_to_game_history()
+
+    def _compute_position_key(self):
+        key = self.zobrist.side_to_move[self._next_player]
+        for colour, own in ((Colour.BLACK, self._black), (Colour.WHITE, self._white)):
+            for s in squares(own):
+                key ^= PIECE_KEYS[(colour, bool(self._kings >> s & 1))][s]
+        if self._piece_to_move is not None:
+            key ^= PENDING_JUMP_KEYS[self._piece_to_move]
+        return key
+
+    @property
+    def turn_count(self):
+        return self._turn_count
+
+    @property
+    def piece_to_move(self):
+        if self._piece_to_move is None:
+            return None
+        return self._piece_at(self._piece_to_move)
+
+    def canonical_key(self, side: Colour):
+        return state_key(self._position_key, side)
+
+    def canonical_history(self, side: Colour):
+        return [state_key(key, side) for key in self.key_history]
+
+    def to_bitboards(self):
+        return self._black, self._white, self._kings
+
+    @property
+    def board(self):
+        board = [[Colour.BLANK] * 8 for _ in range(8)]
+        for s in squares(self._black):
+            row, col = SQUARE_TO_POSITION[s]
+            board[row][col] = Colour.BLACK
+        for s in squares(self._white):
+            row, col = SQUARE_TO_POSITION[s]
+            board[row][col] = Colour.WHITE
+        return board
+
+    @property
+    def pieces(self):
+        return {Colour.WHITE: [self._piece_at(s) for s in squares(self._white)],
+                Colour.BLACK: [self._piece_at(s) for s in squares(self._black)]}
+
+    def material(self, colour: Colour):
+        """(men, kings) that colour has left on the board, counted from the bitboards."""
+        own = self._black if colour == Colour.BLACK else self._white
+        kings = bin(own & self._kings).count('1')
+        return bin(own).count('1') - kings, kings
+
+    def copy(self, include_history=True):
+        game_copy = BitboardCheckers.__new__(BitboardCheckers)
+        game_copy._board = []
+        game_copy._pieces = {}
+        game_copy._black = self._black
+        game_copy._white = self._white
+        game_copy._kings = self._kings
+        game_copy._next_player = self._next_player
+        game_copy._turn_count = self._turn_count
+        game_copy.turns_since_last_piece_taken = self.turns_since_last_piece_taken
+        game_copy._piece_to_move = self._piece_to_move
+        game_copy._position_key = self._position_key
+        game_copy.game_history = self.game_history[:] if include_history else []
+        game_copy.key_history = self.key_history[:] if include_history else []
+        game_copy.move_history = self.move_history[:] if include_history else []
+        return game_copy
+
+    def _piece_at(self, square: int):
+        colour = Colour.BLACK if self._black >> square & 1 else Colour.WHITE
+        piece = Piece(colour, list(SQUARE_TO_POSITION[square]))
+        if self._kings >> square & 1:
+            piece.king_piece()
+        return piece
+
+    def _sides(self, colour: Colour):
+        return (self._black, self._white) if colour == Colour.BLACK else (self._white, self._black)
+
+    def _pieces_moving(self, colour: Colour, direction: Direction):
+        """All pieces of colour that are allowed to move in direction."""
+        own = self._black if colour == Colour.BLACK else self._white
+        return own if direction in MAN_DIRECTIONS[colour] else own & self._kings
+
+    def _jumpers(self, colour: Colour):
+        own, other = self._sides(colour)
+        empty = ~(own | other) & FULL_BOARD
+        jumpers = 0
+        for direction in Direction:
+            back = OPPOSITE_DIRECTION[direction]
+            jumpers |= self._pieces_moving(colour, direction) & step(step(empty, back) & other, back)
+        return jumpers
+
+    def _movers(self, colour: Colour):
+        own, other = self._sides(colour)
+        empty = ~(own | other) & FULL_BOARD
+        movers = 0
+        for direction in Direction:
+            movers |= self._pieces_moving(colour, direction) & step(empty, OPPOSITE_DIRECTION[direction])
+        return movers
+
+    def _can_take(self, bit: int, colour: Colour):
+        own, other = self._sides(colour)
+        empty = ~(own | other) & FULL_BOARD
+        directions = Direction if bit & self._kings else MAN_DIRECTIONS[colour]
+        for direction in directions:
+            if step(step(bit, direction) & other, direction) & empty:
+                return True
+        return False
+
+    def possible_moves(self, side: Colour, **kwargs):
+        # CheckersRunner's must_jump/ind_piece hints are already implied by the game state
+        own, other = self._sides(side)
+        empty = ~(own | other) & FULL_BOARD
+        sources = self._jumpers(side)
+        jumping = bool(sources)
+        if not jumping:
+            sources = self._movers(side)
+        if self._piece_to_move is not None:
+            sources &= 1 << self._piece_to_move
+
+        table = JUMP_MOVES if jumping else STEP_MOVES
+        possible_moves = []
+        for s in squares(sources):
+            bit = 1 << s
+            king = 1 if self._kings & bit else 0
+            for direction in Direction:
+                if not self._pieces_moving(side, direction) & bit:
+                    continue
+                target = step(bit, direction)
+                if jumping:
+                    target = step(target & other, direction)
+                if target & empty:
+                    possible_moves.append(table[direction][s][king])
+        return possible_moves
+
+    def check_move(self, move: CheckersMove):
+        square = POSITION_TO_SQUARE.get(move.start)
+        # Off the board, which includes pieces already taken
+        if square is None:
+            return False, None
+        # Check if double jump required
+        if self._piece_to_move is not None and self._piece_to_move != square:
+            return False, None
+        bit = 1 << square
+        if not (self._black | self._white) & bit:
+            return False, None
+        colour = Colour.BLACK if self._black & bit else Colour.WHITE
+        direction = move.direction
+        # Piece moving backwards illegally, or not moving diagonally at all
+        if direction is None or not self._pieces_moving(colour, direction) & bit:
+            return False, None
+        own, other = self._sides(colour)
+        new_bit = step(bit, direction)
+        if move.is_jump:
+            jump_bit = step(new_bit & other, direction)
+            if not jump_bit or jump_bit & (own | other):
+                return False, None
+            return True, MoveType.JUMP
+        if not new_bit or new_bit & (own | other):
+            return False, None
+        # Player must make a jump if required
+        if self._jumpers(colour):
+            return False, None
+        return True, MoveType.MOVE
+
+    def make_move(self, move):
+        if self.apply(move) is None:
+            return False
+        self.move_history.append(move)
+        self.add_state_to_game_history()
+        return True
+
+    def apply(self, move):
+        """Make move in place without recording it in the game history.
+
+        Returns a token that undo() takes to restore the exact previous state, or None if the move is not allowed.
+        """
+        allowed, m_type = self.check_move(move)
+        if not allowed:
+            return None
+        undo_token = (self._black, self._white, self._kings, self._next_player, self._turn_count,
+                      self.turns_since_last_piece_taken, self._piece_to_move, self._position_key)
+        direction = move.direction
+        start = POSITION_TO_SQUARE[move.start]
+        bit = 1 << start
+        colour = Colour.BLACK if self._black & bit else Colour.WHITE
+        was_king = bool(self._kings & bit)
+        key = self._position_key ^ PIECE_KEYS[(colour, was_king)][start]
+        if self._piece_to_move is not None:
+            key ^= PENDING_JUMP_KEYS[start]
+
+        new_bit = step(bit, direction)
+        if m_type == MoveType.MOVE:
+            self.turns_since_last_piece_taken += 1
+        else:
+            self.turns_since_last_piece_taken = 0
+            key ^= PIECE_KEYS[(colour.other_colour, bool(self._kings & new_bit))][new_bit.bit_length() - 1]
+            if colour == Colour.BLACK:
+                self._white &= ~new_bit
+            else:
+                self._black &= ~new_bit
+            self._kings &= ~new_bit
+            new_bit = step(new_bit, direction)
+
+        if colour == Colour.BLACK:
+            self._black ^= bit | new_bit
+        else:
+            self._white ^= bit | new_bit
+        if was_king:
+            self._kings ^= bit | new_bit
+        # As in Checkers, anything landing on the first or last row is kinged
+        self._kings |= new_bit & PROMOTION_ROWS
+        end = new_bit.bit_length() - 1
+        key ^= PIECE_KEYS[(colour, bool(self._kings & new_bit))][end]
+
+        if m_type == MoveType.MOVE or not self._can_take(new_bit, colour):
+            self._turn_count += 1
+            self._next_player = colour.other_colour
+            key ^= self.zobrist.side_to_move[colour] ^ self.zobrist.side_to_move[self._next_player]
+            self._piece_to_move = None
+        else:
+            key ^= PENDING_JUMP_KEYS[end]
+            self._piece_to_move = end
+        self._position_key = key
+        return undo_token
+
+    def undo(self, undo_token):
+        """Reverse a move made by apply(), given the token it returned."""
+        (self._black, self._white, self._kings, self._next_player, self._turn_count,
+         self.turns_since_last_piece_taken, self._piece_to_move, self._position_key) = undo_token
+
+    def check_jump_required(self, colour: Colour):
+        return bool(self._jumpers(colour))
+
+    def check_end_game(self):
+        if self._turn_count > 100:
+            white_count = bin(self._white).count('1')
+            black_count = bin(self._black).count('1')
+            if white_count > black_count:
+                return Result.WHITE
+            if black_count > white_count:
+                return Result.BLACK
+            return Result.DRAW
+        if self.turns_since_last_piece_taken >= 100:
+            return Result.DRAW
+        colour = self._next_player
+        if self._jumpers(colour) or self._movers(colour):
+            return False
+        # The side left without a move loses
+        return colour.other_colour.to_result
+
+    def add_state_to_game_history(self):
+        if self.key_history and self.key_history[-1] == self._position_key:
+            return
+        board_list = [' '] * 64
+        for s in squares(self._black):
+            row, col = SQUARE_TO_POSITION[s]
+            board_list[8 * row + col] = 'B'
+        for s in squares(self._white):
+            row, col = SQUARE_TO_POSITION[s]
+            board_list[8 * row + col] = 'W'
+        self.game_history.append(''.join(board_list))
+        self.key_history.append(self._position_key)
+
+    def print_board(self):
+        board = self.board
+        for i in range(8):
+            new_row = [colored(255 if board[i][j] != Colour.WHITE else 0,
+                               255 if board[i][j] != Colour.BLACK else 0,
+                               255 if board[i][j] == Colour.BLANK else 0, str(board[i][j])) for j in range(8)]
+            print(sum_l(new_row))
+        print([list(SQUARE_TO_POSITION[s]) for s in squares(self._white)])
+        print([list(SQUARE_TO_POSITION[s]) for s in squares(self._black)])
@@ -8,6 +8,7 @@ class Game:
         self._board = []
         self._pieces = {}  # May not be needed for a game but can be ignored
         self._next_player = None
+        self._position_key = 0  # Zobrist hash of the position, kept up to date by apply/undo
 
     def copy(self, include_history=True):
         pass
@@ -28,6 +29,30 @@ class Game:
     def next_player(self):
         return self._next_player
 
+    @property
+    def position_key(self):
+        return self._position_key
+
+    def canonical_key(self, side):
+        """Key of the position as side sees it, shared by every position equivalent to it by symmetry.
+
+        Games without symmetries just tell the two sides apart.  Needs the subclass's zobrist keys.
+        """
+        return self._position_key ^ self.zobrist.owner[side]
+
+    def canonical_history(self, side):
+        """canonical_key(side) of every position in the game so far."""
+        return [key ^ self.zobrist.owner[side] for key in self.key_history]
+
+    def child_keys(self, moves: list, side):
+        """canonical_key(side) of the position after each of moves, leaving this game as it was."""
+        keys = []
+        for move in moves:
+            undo_token = self.apply(move)
+            keys.append(self.canonical_key(side))
+            self.undo(undo_token)
+        return keys
+
     @abstractmethod
     def possible_moves(self, **kwargs):
         pass
@@ -44,6 +69,15 @@ class Game:
     def check_move(self, move):
         pass
 
+    @abstractmethod
+    def apply(self, move):
+        # Make the move in place and return a token for undo(); used by searches instead of copy()
+        pass
+
+    @abstractmethod
+    def undo(self, undo_token):
+        pass
+
 
 class GameRunner:
     def __init__(self):
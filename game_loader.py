@@ -0,0 +1,149 @@
+"""Per-game summary columns for the analysis notebook, loaded in chunks and cached.
+
+    columns = load_games('games_dump/games.rec')      # or a directory of the older dump_*.pkl pickles
+    pd.Series(columns.turns).rolling(100).mean()
+
+Record files (see game_records.py) are replayed a chunk of games at a time in lockstep on
+checkers_batch.BitboardBatch to find each game's final position; turns come straight from the record
+index.  Pickled dumps are read one file at a time.  Either way only the columns are kept, never the
+histories, and they are cached with array_file beside the source (path + '.columns', or columns.bin in
+a dump directory) and reused for as long as the source is unchanged.
+"""
+import glob
+import os
+import pickle
+from collections import namedtuple
+
+import numpy as np
+
+from array_file import load_arrays, save_arrays
+from checkers_batch import BitboardBatch, count
+from checkers_bitboard import SQUARE_TO_POSITION
+from game_records import RESULT_CODES, RESULT_NAMES, GameRecordReader, index_path
+
+
+FILE_KIND = 'game_columns'
+CHUNK = 4096
+
+# results holds game_records.RESULT_CODES; the final position is three 32-square bitboards as
+# BitboardCheckers holds them.  turns counts boards in the game history, the start included.
+GameColumns = namedtuple('GameColumns', ['results', 'turns', 'pieces_left', 'final_black', 'final_white',
+                                         'final_kings'])
+
+
+def _empty_columns():
+    return GameColumns(np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int8),
+                       np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32))
+
+
+def _concatenate(chunks: list):
+    chunks = [_empty_columns()] + chunks
+    return GameColumns(*(np.concatenate(column) for column in zip(*chunks)))
+
+
+def result_names(columns: GameColumns):
+    """The winner's name ('BLACK', 'WHITE' or 'DRAW') of every game."""
+    names = np.array([RESULT_NAMES[code] for code in range(len(RESULT_NAMES))])
+    return names[columns.results]
+
+
+def board_string(columns: GameColumns, game_number: int):
+    """The final board of a game as a 64-character game_history string."""
+    board = [' '] * 64
+    black = int(columns.final_black[game_number])
+    white = int(columns.final_white[game_number])
+    for square, (row, col) in enumerate(SQUARE_TO_POSITION):
+        if black >> square & 1:
+            board[8 * row + col] = 'B'
+        elif white >> square & 1:
+            board[8 * row + col] = 'W'
+    return ''.join(board)
+
+
+def record_chunks(path: str, chunk_size: int = CHUNK, start: int = 0):
+    """Yield GameColumns for the games of a record file from game number start, chunk_size games at a time."""
+    with GameRecordReader(path) as records:
+        for chunk_start in range(start, len(records), chunk_size):
+            chunk_stop = min(chunk_start + chunk_size, len(records))
+            codes = records.move_code_range(chunk_start, chunk_stop)
+            lengths = records.lengths[chunk_start:chunk_stop].astype(np.int64)
+            batch = BitboardBatch(len(codes))
+            for ply in range(codes.shape[1]):
+                # Each game stops where its record does
+                batch.done = ply >= lengths
+                if batch.done.all():
+                    break
+                hops = np.maximum(codes[:, ply], 0)
+                batch.play(hops // 4, hops % 4)
+            results = records.index['result'][chunk_start:chunk_stop].astype(np.int8)
+            yield GameColumns(results, (lengths + 1).astype(np.int32),
+                              (count(batch.black) + count(batch.white)).astype(np.int8),
+                              batch.black, batch.white, batch.kings)
+
+
+def _pack_board(board: str):
+    black, white = 0, 0
+    for square, (row, col) in enumerate(SQUARE_TO_POSITION):
+        if board[8 * row + col] == 'B':
+            black |= 1 << square
+        elif board[8 * row + col] == 'W':
+            white |= 1 << square
+    return black, white
+
+
+def dump_files(dump_dir: str):
+    """The dump_N.pkl files of a directory in the order they were written."""
+    paths = glob.glob(os.path.join(dump_dir, 'dump_*.pkl'))
+    return sorted(paths, key=lambda path: int(os.path.basename(path)[len('dump_'):-len('.pkl')]))
+
+
+def dump_columns(path: str):
+    """GameColumns for one pickled dump.  Board strings don't show kings, so final_kings is 0."""
+    with open(path, 'rb') as f:
+        winners, histories = pickle.load(f)
+    finals = np.array([_pack_board(history[-1]) for history in histories], dtype=np.uint32).reshape(-1, 2)
+    return GameColumns(np.array([RESULT_CODES[winner] for winner in winners], dtype=np.int8),
+                       np.array([len(history) for history in histories], dtype=np.int32),
+                       (count(finals[:, 0]) + count(finals[:, 1])).astype(np.int8),
+                       finals[:, 0], finals[:, 1], np.zeros(len(finals), dtype=np.uint32))
+
+
+def dump_chunks(dump_dir: str):
+    """Yield GameColumns for each pickled dump in dump_dir."""
+    for path in dump_files(dump_dir):
+        yield dump_columns(path)
+
+
+def _source_signature(source: str):
+    # What the cache was built from; any change to it means building again
+    if os.path.isdir(source):
+        paths = dump_files(source)
+    else:
+        paths = [source, index_path(source)]
+    return [[os.path.basename(path), os.path.getsize(path), os.stat(path).st_mtime_ns] for path in paths]
+
+
+def cache_path(source: str):
+    return os.path.join(source, 'columns.bin') if os.path.isdir(source) else source + '.columns'
+
+
+def load_games(source: str, chunk_size: int = CHUNK, use_cache: bool = True):
+    """GameColumns for every game in a record file or a directory of pickled dumps."""
+    signature = _source_signature(source)
+    path = cache_path(source)
+    if use_cache and os.path.exists(path):
+        meta, arrays = load_arrays(path, FILE_KIND)
+        if meta['source'] == signature:
+            return GameColumns(**arrays)
+
+    if os.path.isdir(source):
+        columns = _concatenate(list(dump_chunks(source)))
+    else:
+        columns = _concatenate(list(record_chunks(source, chunk_size)))
+    if use_cache:
+        try:
+            save_arrays(path, FILE_KIND, columns._asdict(), meta={'source': signature})
+        except OSError:
+            # Somewhere read-only; the columns are still good without the cache
+            pass
+    return columns
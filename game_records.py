@@ -0,0 +1,176 @@
+"""Append-only binary records of checkers games, in place of pickled lists of board strings.
+
+A record file holds each game as its moves, one byte per hop: 4 * the start square (as BitboardCheckers
+numbers them) + the direction.  In any position only one legal move starts from a given square in a
+given direction, so replaying the bytes from the start position gives back the moves, and with them
+the game's board history.  Beside it, path + '.idx' holds one fixed-width entry per game, (offset,
+length, result), so any game can be read without touching the others.
+
+    with GameRecordWriter('games_dump/games.rec') as writer:
+        writer.write('BLACK', game.move_history)
+
+    records = GameRecordReader('games_dump/games.rec')
+    records.results[-1], records.history(len(records) - 1)
+
+Games are appended as they finish, the moves before their index entry, so a run that dies part way
+leaves every game it recorded readable.
+"""
+import os
+
+import numpy as np
+
+from checkers import Direction
+from checkers_bitboard import POSITION_TO_SQUARE, BitboardCheckers
+
+
+MAGIC = b'CKRGAME1'
+INDEX_MAGIC = b'CKRINDX1'
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('length', '<u4'), ('result', 'i1'), ('padding', 'V3')])
+RESULT_CODES = {'DRAW': 0, 'BLACK': 1, 'WHITE': 2}
+RESULT_NAMES = {code: name for name, code in RESULT_CODES.items()}
+DIRECTIONS = list(Direction)
+
+
+def index_path(path: str):
+    return path + '.idx'
+
+
+def move_code(move):
+    """A move as 4 * its start square + its direction, as checkers_batch numbers hops."""
+    return 4 * POSITION_TO_SQUARE[move.start] + DIRECTIONS.index(move.direction)
+
+
+def code_move(game, code: int):
+    """The legal move in game with the given code."""
+    code = int(code)
+    for move in game.possible_moves(game.next_player):
+        if move_code(move) == code:
+            return move
+    raise ValueError('no legal move has code {} in turn {}'.format(code, game.turn_count))
+
+
+def replay(codes, game_class=BitboardCheckers):
+    """The game reached by playing codes from the start position."""
+    game = game_class()
+    for code in codes:
+        game.make_move(code_move(game, code))
+    return game
+
+
+class GameRecordWriter:
+    """Appends games to a record file, creating it if needed."""
+    def __init__(self, path: str):
+        self.path = path
+        self._data = self._open(path, MAGIC)
+        self._index = self._open(index_path(path), INDEX_MAGIC)
+        # Drop a partial entry left by a run that died while writing it
+        size = self._index.seek(0, os.SEEK_END)
+        self._index.truncate(size - (size - len(INDEX_MAGIC)) % INDEX_DTYPE.itemsize)
+        self._index.seek(0, os.SEEK_END)
+
+    @staticmethod
+    def _open(path: str, magic: bytes):
+        f = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        header = f.read(len(magic))
+        if not header:
+            f.write(magic)
+        elif header != magic:
+            f.close()
+            raise ValueError('{} is not a game record file'.format(path))
+        return f
+
+    def write(self, winner: str, moves: list):
+        """Append one game, given the winner's name ('BLACK', 'WHITE' or 'DRAW') and its moves."""
+        offset = self._data.seek(0, os.SEEK_END)
+        self._data.write(bytes(move_code(move) for move in moves))
+        self._data.flush()
+        entry = np.zeros(1, dtype=INDEX_DTYPE)
+        entry['offset'] = offset
+        entry['length'] = len(moves)
+        entry['result'] = RESULT_CODES[winner]
+        self._index.write(entry.tobytes())
+        self._index.flush()
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class GameRecordReader:
+    """Reads a record file.  The index is loaded whole; each game's moves are read on demand."""
+    def __init__(self, path: str, game_class=BitboardCheckers):
+        self.path = path
+        self.game_class = game_class
+        with open(index_path(path), 'rb') as f:
+            if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                raise ValueError('{} is not a game record index'.format(index_path(path)))
+            data = f.read()
+        self.index = np.frombuffer(data[:len(data) - len(data) % INDEX_DTYPE.itemsize], dtype=INDEX_DTYPE)
+        self._data = open(path, 'rb')
+        if self._data.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a game record file'.format(path))
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def results(self):
+        """The winner's name for every game."""
+        return [RESULT_NAMES[code] for code in self.index['result'].tolist()]
+
+    @property
+    def lengths(self):
+        """The number of moves (hops) in every game."""
+        return self.index['length']
+
+    def move_codes(self, game_number: int):
+        entry = self.index[game_number]
+        self._data.seek(int(entry['offset']))
+        return np.frombuffer(self._data.read(int(entry['length'])), dtype=np.uint8)
+
+    def move_code_range(self, start: int, stop: int):
+        """The moves of games start to stop - 1 in one read, as a (games, longest) int16 array padded with -1."""
+        entries = self.index[start:stop]
+        if len(entries) == 0:
+            return np.zeros((0, 0), dtype=np.int16)
+        first = int(entries['offset'][0])
+        self._data.seek(first)
+        data = np.frombuffer(self._data.read(int(entries['offset'][-1] + entries['length'][-1]) - first), dtype=np.uint8)
+        lengths = entries['length'].astype(np.int64)
+        codes = np.full((len(entries), max(int(lengths.max()), 1)), -1, dtype=np.int16)
+        plies = np.arange(codes.shape[1])
+        played = plies[None, :] < lengths[:, None]
+        positions = (entries['offset'].astype(np.int64) - first)[:, None] + plies[None, :]
+        codes[played] = data[positions[played]]
+        return codes
+
+    def game(self, game_number: int):
+        """The finished game, replayed in game_class."""
+        return replay(self.move_codes(game_number), self.game_class)
+
+    def moves(self, game_number: int):
+        return self.game(game_number).move_history
+
+    def history(self, game_number: int):
+        """The board strings the game went through, as game_history records them."""
+        return self.game(game_number).game_history
+
+    def __iter__(self):
+        """(winner, board history) for every game, in the order they were written."""
+        for game_number, winner in enumerate(self.results):
+            yield winner, self.history(game_number)
+
+    def close(self):
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,315 @@
+import multiprocessing
+from collections.abc import Mapping
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from array_file import load_arrays, save_arrays
+
+
+# Column of each counter in a row of statistics.  SEEN is a flag, 1 once a position has been in any
+# recorded game, so merges keep the larger value rather than adding; the others count occurrences.
+SEEN = 0
+WON = 1
+DRAWN = 2
+LOST = 3
+
+# Key 0 marks an empty slot, so a real key of 0 is stored as this instead
+ZERO_KEY = 0x9E3779B97F4A7C15
+
+
+def count_outcome(state_keys, outcome: int, updates: dict = None):
+    """Flag each key as seen and add one outcome per occurrence to updates, a dict of key -> [seen, won, drawn, lost]."""
+    updates = {} if updates is None else updates
+    for key in state_keys:
+        counts = updates.get(key)
+        if counts is None:
+            counts = updates[key] = [0, 0, 0, 0]
+        counts[SEEN] = 1
+        counts[outcome] += 1
+    return updates
+
+
+class DictLearnerStats:
+    """Learner statistics in four plain dicts, for use inside one process."""
+    def __init__(self):
+        self.seen = {}
+        self.won = {}
+        self.drawn = {}
+        self.lost = {}
+
+    def __len__(self):
+        return len(self.seen)
+
+    def __iter__(self):
+        return iter(self.seen)
+
+    def get(self, key: int):
+        if key not in self.seen:
+            return None
+        return self.seen[key], self.won[key], self.drawn[key], self.lost[key]
+
+    def lookup_many(self, keys):
+        """Counts for each of keys as a (len(keys), 4) array, with zeros for keys never seen."""
+        return np.array([self.get(int(key)) or (0, 0, 0, 0) for key in keys], dtype=np.uint32).reshape(-1, 4)
+
+    def merge(self, updates: dict):
+        for key, (seen, won, drawn, lost) in updates.items():
+            self.seen[key] = max(self.seen.get(key, 0), seen)
+            self.won[key] = self.won.get(key, 0) + won
+            self.drawn[key] = self.drawn.get(key, 0) + drawn
+            self.lost[key] = self.lost.get(key, 0) + lost
+
+
+class CompactLearnerStats:
+    """Learner statistics in one open-addressing hash table of fixed-width NumPy arrays.
+
+    A row is a 64-bit position key plus four 32-bit counters, 24 bytes in all, against a couple of hundred
+    bytes per position for four dicts of boxed ints.  Slots are picked by the low bits of the key with
+    linear probing, and the table doubles and rehashes once it is three quarters full.
+
+    save() writes the table to disk as it is, empty slots and all, and load() maps it straight back in, so
+    a restarted training run or a pool of evaluation processes can pick it up without rebuilding it.
+    """
+    FILE_KIND = 'learner_stats'
+
+    def __init__(self, capacity: int = 1 << 16):
+        size = 1
+        while size < capacity:
+            size *= 2
+        self._keys = np.zeros(size, dtype=np.uint64)
+        self._counts = np.zeros((size, 4), dtype=np.uint32)
+        self._mask = size - 1
+        self._used = 0
+
+    @classmethod
+    def load(cls, path: str, writable: bool = True):
+        """Open a table written by save().
+
+        With writable the table is mapped copy-on-write: it learns in memory and the file only changes
+        when it is saved again.  Otherwise the pages are read-only and shared by every process that maps
+        the file, and merge() fails.
+        """
+        meta, arrays = load_arrays(path, cls.FILE_KIND, mode='c' if writable else 'r')
+        stats = cls.__new__(cls)
+        stats._keys = arrays['keys']
+        stats._counts = arrays['counts']
+        stats._mask = len(stats._keys) - 1
+        stats._used = meta['used']
+        return stats
+
+    def save(self, path: str):
+        # Atomic, so a crash part way through leaves the previous save in place
+        save_arrays(path, self.FILE_KIND, {'keys': self._keys, 'counts': self._counts}, {'used': self._used})
+
+    def __len__(self):
+        return self._used
+
+    def __iter__(self):
+        return iter(self._keys[self._keys != 0].tolist())
+
+    @property
+    def nbytes(self):
+        return self._keys.nbytes + self._counts.nbytes
+
+    def get(self, key: int):
+        key = key or ZERO_KEY
+        keys = self._keys
+        mask = self._mask
+        slot = key & mask
+        while True:
+            stored = keys.item(slot)
+            if stored == key:
+                return tuple(self._counts[slot].tolist())
+            if stored == 0:
+                return None
+            slot = (slot + 1) & mask
+
+    def lookup_many(self, keys):
+        """Counts for each of keys as a (len(keys), 4) array, with zeros for keys never seen."""
+        keys = np.asarray(keys, dtype=np.uint64)
+        keys = np.where(keys == 0, np.uint64(ZERO_KEY), keys)
+        slots = self._find_many(keys)
+        counts = self._counts[slots]
+        counts[self._keys[slots] != keys] = 0
+        return counts
+
+    def _find_many(self, keys):
+        """Slot holding each of an array of keys, or the empty slot that ends its probe."""
+        mask = self._mask
+        slots = (keys & np.uint64(mask)).astype(np.intp)
+        pending = np.arange(len(keys))
+        while len(pending):
+            stored = self._keys[slots[pending]]
+            pending = pending[(stored != keys[pending]) & (stored != 0)]
+            slots[pending] = (slots[pending] + 1) & mask
+        return slots
+
+    def _insert_new(self, keys, counts):
+        """Add rows for an array of distinct keys that are not in the table yet."""
+        mask = self._mask
+        slots = (keys & np.uint64(mask)).astype(np.intp)
+        pending = np.arange(len(keys))
+        while len(pending):
+            free = pending[self._keys[slots[pending]] == 0]
+            # When several keys probe to the same empty slot the first one takes it and the rest move on
+            taken, first = np.unique(slots[free], return_index=True)
+            winners = free[first]
+            self._keys[taken] = keys[winners]
+            self._counts[taken] = counts[winners]
+            pending = np.setdiff1d(pending, winners, assume_unique=True)
+            slots[pending] = (slots[pending] + 1) & mask
+        self._used += len(keys)
+
+    def _grow(self, needed: int):
+        size = self._mask + 1
+        while needed * 4 > size * 3:
+            size *= 2
+        if size == self._mask + 1:
+            return
+        used = self._keys != 0
+        keys, counts = self._keys[used], self._counts[used]
+        self._keys = np.zeros(size, dtype=np.uint64)
+        self._counts = np.zeros((size, 4), dtype=np.uint32)
+        self._mask = size - 1
+        self._used = 0
+        self._insert_new(keys, counts)
+
+    def merge(self, updates: dict):
+        """Add a batch of key -> [seen, won, drawn, lost] updates."""
+        if not updates:
+            return
+        keys = np.fromiter((key or ZERO_KEY for key in updates), dtype=np.uint64, count=len(updates))
+        counts = np.array(list(updates.values()), dtype=np.uint32).reshape(-1, 4)
+        self._grow(self._used + len(keys))
+        slots = self._find_many(keys)
+        found = self._keys[slots] == keys
+        old_seen = self._counts[slots[found], SEEN]
+        self._counts[slots[found]] += counts[found]
+        self._counts[slots[found], SEEN] = np.maximum(old_seen, counts[found][:, SEEN])
+        self._insert_new(keys[~found], counts[~found])
+
+
+class SharedLearnerStats:
+    """Learner statistics in a shared-memory hash table that many processes can update at once.
+
+    The table is split into stripes, each an open-addressing table with linear probing and its own lock,
+    so writers only contend when they touch the same stripe.  A row is a 64-bit key plus four 32-bit
+    counters.  Readers do not take locks and may see counts from just before a concurrent merge.
+
+    Create the table in the parent and hand it to workers through the pool initializer; it pickles as
+    the shared memory name plus the locks, and reattaches on the other side.
+    """
+    def __init__(self, capacity: int = 1 << 20, stripes: int = 64, context=None):
+        stripe_size = 1
+        while stripe_size * stripes < capacity:
+            stripe_size *= 2
+        self._stripes = stripes
+        self._stripe_size = stripe_size
+        # The locks must come from the same multiprocessing context as the pool that will use them
+        self._locks = [(context or multiprocessing).Lock() for _ in range(stripes)]
+        self._memory = SharedMemory(create=True, size=stripes * stripe_size * 24)
+        self._owner = True
+        self._attach_arrays()
+        self._keys[:] = 0
+        self._counts[:] = 0
+
+    def _attach_arrays(self):
+        capacity = self._stripes * self._stripe_size
+        self._keys = np.ndarray((capacity,), dtype=np.uint64, buffer=self._memory.buf)
+        self._counts = np.ndarray((capacity, 4), dtype=np.uint32, buffer=self._memory.buf, offset=capacity * 8)
+
+    def __getstate__(self):
+        return self._memory.name, self._stripes, self._stripe_size, self._locks
+
+    def __setstate__(self, state):
+        name, self._stripes, self._stripe_size, self._locks = state
+        self._memory = SharedMemory(name=name)
+        self._owner = False
+        self._attach_arrays()
+
+    def __len__(self):
+        return int(np.count_nonzero(self._keys))
+
+    def __iter__(self):
+        return iter(self._keys[self._keys != 0].tolist())
+
+    def _stripe(self, key: int):
+        return (key >> 40) % self._stripes
+
+    def _find(self, key: int, stripe: int):
+        """Index of key's row in the stripe, or of the empty slot where it would go, or None if full."""
+        base = stripe * self._stripe_size
+        mask = self._stripe_size - 1
+        slot = key & mask
+        for _ in range(self._stripe_size):
+            stored = int(self._keys[base + slot])
+            if stored == key or stored == 0:
+                return base + slot
+            slot = (slot + 1) & mask
+        return None
+
+    def get(self, key: int):
+        key = key or ZERO_KEY
+        index = self._find(key, self._stripe(key))
+        if index is None or int(self._keys[index]) != key:
+            return None
+        return tuple(int(count) for count in self._counts[index])
+
+    def lookup_many(self, keys):
+        """Counts for each of keys as a (len(keys), 4) array, with zeros for keys never seen."""
+        return np.array([self.get(int(key)) or (0, 0, 0, 0) for key in keys], dtype=np.uint32).reshape(-1, 4)
+
+    def merge(self, updates: dict):
+        """Add a batch of key -> [seen, won, drawn, lost] updates, taking each stripe's lock once."""
+        by_stripe = {}
+        for key, counts in updates.items():
+            key = key or ZERO_KEY
+            by_stripe.setdefault(self._stripe(key), []).append((key, counts))
+        for stripe, rows in by_stripe.items():
+            with self._locks[stripe]:
+                for key, counts in rows:
+                    index = self._find(key, stripe)
+                    if index is None:
+                        raise RuntimeError('Shared learner statistics stripe {} is full'.format(stripe))
+                    seen = max(self._counts[index, SEEN], counts[SEEN])
+                    self._counts[index] += np.asarray(counts, dtype=np.uint32)
+                    self._counts[index, SEEN] = seen
+                    # Counts first and key last, so readers never find a key with another key's counts
+                    self._keys[index] = key
+
+    def close(self):
+        self._keys = None
+        self._counts = None
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+
+
+class StatsView(Mapping):
+    """Read-only dict-style view of one counter, e.g. WON, of a learner statistics store."""
+    def __init__(self, stats, column: int):
+        self._stats = stats
+        self._column = column
+
+    def __getitem__(self, key: int):
+        counts = self._stats.get(key)
+        if counts is None:
+            raise KeyError(key)
+        return counts[self._column]
+
+    def __iter__(self):
+        return iter(self._stats)
+
+    def __len__(self):
+        return len(self._stats)
+
+
+class StatsColumn:
+    """Class attribute that views one counter of whatever stats store the class is currently using."""
+    def __init__(self, column: int):
+        self._column = column
+
+    def __get__(self, instance, owner):
+        stats = owner.stats if instance is None else instance.stats
+        return StatsView(stats, self._column)
@@ -0,0 +1,77 @@
+class MoveOrdering:
+    """Leaves moves in the order the game generates them, apart from searching the hash move first.
+
+    Subclasses reorder the moves at each node and learn from the moves that cause beta cutoffs.
+    """
+    def order(self, moves: list, ply: int, hash_move=None):
+        if hash_move is not None and hash_move in moves:
+            moves.remove(hash_move)
+            moves.insert(0, hash_move)
+        return moves
+
+    def cutoff(self, move, ply: int, depth: int):
+        pass
+
+    def new_search(self):
+        pass
+
+
+class HeuristicOrdering(MoveOrdering):
+    """Orders checkers moves by hash move, then jumps and promotions, then killer moves, then history.
+
+    Killer moves are the last quiet moves that caused a cutoff at the same ply, and are forgotten between
+    searches.  The history table counts cutoffs per move, weighted by depth squared, and is kept across
+    searches (halved each time so old games fade out).
+    """
+    HASH_MOVE_SCORE = 1 << 30
+    JUMP_SCORE = 1 << 28
+    PROMOTION_SCORE = 1 << 27
+    KILLER_SCORE = 1 << 26
+
+    def __init__(self, captures=True, killers=True, history=True, num_killers=2):
+        self._captures = captures
+        self._killers = [] if killers else None
+        self._history = {} if history else None
+        self._num_killers = num_killers
+
+    def order(self, moves: list, ply: int, hash_move=None):
+        killers = self._killers[ply] if self._killers is not None and ply < len(self._killers) else ()
+        history = self._history
+
+        def score(move):
+            value = 0
+            if move == hash_move:
+                value += self.HASH_MOVE_SCORE
+            if self._captures:
+                if move.is_jump:
+                    value += self.JUMP_SCORE
+                if move.promotes:
+                    value += self.PROMOTION_SCORE
+            if move in killers:
+                value += self.KILLER_SCORE
+            if history:
+                value += history.get(move, 0)
+            return value
+
+        moves.sort(key=score, reverse=True)
+        return moves
+
+    def cutoff(self, move, ply: int, depth: int):
+        if move.is_jump:
+            # Jumps already come first
+            return
+        if self._killers is not None:
+            while len(self._killers) <= ply:
+                self._killers.append([])
+            killers = self._killers[ply]
+            if move not in killers:
+                killers.insert(0, move)
+                del killers[self._num_killers:]
+        if self._history is not None:
+            self._history[move] = self._history.get(move, 0) + depth * depth
+
+    def new_search(self):
+        if self._killers is not None:
+            self._killers = []
+        if self._history:
+            self._history = {move: count // 2 for move, count in self._history.items() if count > 1}
@@ -0,0 +1,162 @@
+"""Opening book built from the games run_game.py dumps, consulted by AlphaBetaAI before it searches.
+
+    python opening_book.py [games] [book_path] [plies]
+
+reads the game record file games (games_dump/games.rec by default) and plays the first plies recorded
+moves of each game, or, given a directory of the older dump_*.pkl pickles, replays each game to recover
+its moves from the recorded boards; then writes the results of each move from each position it was
+played in.  The book is an array_file of rows sorted by position key, so a lookup is a binary search in
+memory-mapped arrays.
+"""
+import glob
+import os
+import pickle
+import sys
+
+import numpy as np
+
+from array_file import load_arrays, save_arrays
+from checkers_bitboard import BitboardCheckers
+from game_records import GameRecordReader, code_move, move_code
+
+
+FILE_KIND = 'opening_book'
+# Columns of OpeningBook.counts, from the point of view of the side that made the move
+GAMES = 0
+WINS = 1
+DRAWS = 2
+LOSSES = 3
+
+
+def load_dumps(dump_dir: str):
+    """Yield (winner, board history) for every game in the pickles run_game.py used to write."""
+    for path in sorted(glob.glob(os.path.join(dump_dir, 'dump_*.pkl'))):
+        with open(path, 'rb') as f:
+            winners, histories = pickle.load(f)
+        for winner, history in zip(winners, histories):
+            yield winner, history
+
+
+def replay(history: list, plies: int, game_class=BitboardCheckers):
+    """Yield (position key, side to move, move) for the first plies moves of a game's board history.
+
+    Each move is the legal move that leads to the next recorded board.  Replay stops early at a board no
+    legal move reaches, e.g. a history from some other variant of the rules.
+    """
+    game = game_class()
+    for board in history[1:plies + 1]:
+        side = game.next_player
+        for move in game.possible_moves(side):
+            undo_token = game.apply(move)
+            game.add_state_to_game_history()
+            if game.game_history[-1] == board:
+                game.undo(undo_token)
+                break
+            game.game_history.pop()
+            game.key_history.pop()
+            game.undo(undo_token)
+        else:
+            return
+        yield game.position_key, side, move
+        game.make_move(move)
+
+
+def replay_codes(codes, plies: int, game_class=BitboardCheckers):
+    """Yield (position key, side to move, move) for the first plies moves of a game's record move codes."""
+    game = game_class()
+    for code in codes[:plies]:
+        move = code_move(game, code)
+        yield game.position_key, game.next_player, move
+        game.apply(move)
+
+
+def count_openings(games):
+    """Count the results of each (position, move), given (winner, that game's replay or replay_codes) per game."""
+    counts = {}
+    for winner, openings in games:
+        for key, side, move in openings:
+            row = counts.setdefault((key, move_code(move)), [0, 0, 0, 0])
+            row[GAMES] += 1
+            if winner == 'DRAW':
+                row[DRAWS] += 1
+            elif winner == side.name:
+                row[WINS] += 1
+            else:
+                row[LOSSES] += 1
+    return counts
+
+
+def build_book(games, plies: int = 16):
+    """Count the results of each (position, move) in the openings of games, an iterable of (winner, history)."""
+    return count_openings((winner, replay(history, plies)) for winner, history in games)
+
+
+def build_record_book(records: GameRecordReader, plies: int = 16):
+    """Count the results of each (position, move) in the openings of the games in a record file."""
+    return count_openings((winner, replay_codes(records.move_codes(game_number), plies, records.game_class))
+                          for game_number, winner in enumerate(records.results))
+
+
+def save_book(path: str, counts: dict):
+    rows = sorted(counts.items())
+    keys = np.array([key for (key, _), _ in rows], dtype=np.uint64)
+    moves = np.array([code for (_, code), _ in rows], dtype=np.uint8)
+    save_arrays(path, FILE_KIND, {'keys': keys, 'moves': moves,
+                                  'counts': np.array([row for _, row in rows], dtype=np.uint32).reshape(-1, 4)})
+
+
+class OpeningBook:
+    """A book written by save_book, memory-mapped read-only.  Pickles as its path."""
+    def __init__(self, path: str, min_games: int = 1):
+        self.path = path
+        self.min_games = min_games
+        _, arrays = load_arrays(path, FILE_KIND)
+        self._keys = arrays['keys']
+        self._moves = arrays['moves']
+        self._counts = arrays['counts']
+        self.hits = 0
+
+    def __getstate__(self):
+        return self.path, self.min_games
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def lookup(self, key: int):
+        """{move code: [games, wins, draws, losses]} for every move the book has from the position."""
+        key = np.uint64(key)
+        start = np.searchsorted(self._keys, key, side='left')
+        end = np.searchsorted(self._keys, key, side='right')
+        return {int(code): self._counts[row].tolist() for row, code in zip(range(start, end), self._moves[start:end])}
+
+    def choose(self, game, moves: list):
+        """The book move with the best score (wins plus half the draws) among moves, or None."""
+        entries = self.lookup(game.position_key)
+        best_move = None
+        best_score = None
+        for move in moves:
+            row = entries.get(move_code(move))
+            if row is None or row[GAMES] < self.min_games:
+                continue
+            score = ((row[WINS] + row[DRAWS] / 2.) / row[GAMES], row[GAMES])
+            if best_score is None or score > best_score:
+                best_move, best_score = move, score
+        if best_move is not None:
+            self.hits += 1
+        return best_move
+
+
+if __name__ == '__main__':
+    games_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join('games_dump', 'games.rec')
+    book_path = sys.argv[2] if len(sys.argv) > 2 else 'opening_book.bin'
+    plies = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+    if os.path.isdir(games_path):
+        counts = build_book(load_dumps(games_path), plies)
+    else:
+        with GameRecordReader(games_path) as records:
+            counts = build_record_book(records, plies)
+    save_book(book_path, counts)
+    print('{} positions and moves written to {}'.format(len(counts), book_path))
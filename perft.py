@@ -0,0 +1,157 @@
+"""Perft: count the leaf nodes of the full game tree to a fixed depth, to check and time move generation.
+
+    python perft.py 6             # every engine from the start, checked against the counts recorded here
+    python perft.py 5 divide      # the count broken down by root move, engine against engine
+    python perft.py 4 positions   # divide compared between the engines at 20 random positions
+    python perft.py 8 turns       # whole moves counted, checked against the published figures
+
+Depth is in plies as the engines count them, so every hop of a multi-jump is a ply of its own.  That
+makes counts from depth 7 on lower than published checkers perft figures, which count a whole multi-jump
+as one move; perft_turns counts that way.  Leaves are counted without checking for the end of the game,
+so draws by the move limit don't cut the tree short; a side with no moves simply has no children.
+"""
+import random
+import sys
+import time
+
+from checkers import Checkers
+from checkers_bitboard import BitboardCheckers
+
+
+ENGINES = [Checkers, BitboardCheckers]
+
+# perft of the start position as these engines count it, to depth 8 from the original Checkers engine and
+# 9 from BitboardCheckers.  They are not outside references, so they only show that the engines agree with
+# each other and with earlier runs.  To depth 6 they equal the published figures; from depth 7 on they are
+# lower because each later hop of a multi-jump takes a ply of its own.
+START_COUNTS = {1: 7, 2: 49, 3: 302, 4: 1469, 5: 7361, 6: 36768, 7: 179255, 8: 838248, 9: 3866526}
+# Published English draughts perft of the start position, counting whole moves: the outside check, made
+# with perft_turns.  Beyond these depths the rules differ too: here a man crowned part way through a jump
+# carries on jumping as a king, where English draughts ends the move on crowning, and that happens within
+# 8 moves of the start.
+PUBLISHED_COUNTS = {1: 7, 2: 49, 3: 302, 4: 1469, 5: 7361, 6: 36768, 7: 179740, 8: 845931}
+
+
+def perft(game, depth: int):
+    """The number of positions depth plies from game, making and unmaking moves on it in place."""
+    if depth == 0:
+        return 1
+    moves = game.possible_moves(game.next_player)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        undo_token = game.apply(move)
+        nodes += perft(game, depth - 1)
+        game.undo(undo_token)
+    return nodes
+
+
+def perft_turns(game, depth: int):
+    """perft counting depth whole moves rather than plies, a multi-jump followed to its end as one move."""
+    if depth == 0:
+        return 1
+    side = game.next_player
+    nodes = 0
+    for move in game.possible_moves(side):
+        undo_token = game.apply(move)
+        # The same side still to move means the jump carries on
+        nodes += perft_turns(game, depth if game.next_player == side else depth - 1)
+        game.undo(undo_token)
+    return nodes
+
+
+def divide(game, depth: int):
+    """{root move: perft of the position after it to depth - 1}."""
+    counts = {}
+    for move in game.possible_moves(game.next_player):
+        undo_token = game.apply(move)
+        counts[move] = perft(game, depth - 1)
+        game.undo(undo_token)
+    return counts
+
+
+def timed_perft(game, depth: int):
+    """(nodes, seconds, nodes per second)."""
+    start = time.perf_counter()
+    nodes = perft(game, depth)
+    seconds = time.perf_counter() - start
+    return nodes, seconds, nodes / seconds if seconds > 0 else float('inf')
+
+
+def random_moves(num_positions: int, plies: int, seed: int):
+    """Lists of moves reaching num_positions positions by random play, so every engine can reach the same ones."""
+    rng = random.Random(seed)
+    lines = []
+    while len(lines) < num_positions:
+        game = Checkers()
+        line = []
+        for _ in range(plies):
+            if game.check_end_game():
+                break
+            # Sort so the line doesn't depend on the order the engine generates moves in
+            move = rng.choice(sorted(game.possible_moves(game.next_player), key=repr))
+            game.make_move(move)
+            line.append(move)
+        if not game.check_end_game():
+            lines.append(line)
+    return lines
+
+
+def reach(game_class, moves: list):
+    game = game_class()
+    for move in moves:
+        game.make_move(move)
+    return game
+
+
+def compare_divide(depth: int, moves: list = (), engines=ENGINES):
+    """The root moves whose divide counts differ between the engines at the position after moves.
+
+    Returns {move: [count from each engine]}, empty if they all agree.  Missing moves count as None.
+    """
+    divides = [divide(reach(game_class, moves), depth) for game_class in engines]
+    all_moves = set().union(*divides)
+    return {move: [counts.get(move) for counts in divides] for move in all_moves
+            if len(set(counts.get(move) for counts in divides)) > 1}
+
+
+if __name__ == '__main__':
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    mode = sys.argv[2] if len(sys.argv) > 2 else 'perft'
+    if mode == 'perft':
+        for game_class in ENGINES:
+            nodes, seconds, rate = timed_perft(game_class(), depth)
+            expected = START_COUNTS.get(depth)
+            check = '' if expected is None else ('as recorded' if nodes == expected else
+                                                 'DIFFERENT, recorded {}'.format(expected))
+            print('{:>16}: {:10d} nodes {:8.2f}s {:10.0f} nodes/s {}'.format(
+                game_class.__name__, nodes, seconds, rate, check))
+    elif mode == 'turns':
+        for game_class in ENGINES:
+            start = time.perf_counter()
+            nodes = perft_turns(game_class(), depth)
+            expected = PUBLISHED_COUNTS.get(depth)
+            check = '' if expected is None else ('matches published' if nodes == expected else
+                                                 'WRONG, published {}'.format(expected))
+            print('{:>16}: {:10d} nodes {:8.2f}s {}'.format(
+                game_class.__name__, nodes, time.perf_counter() - start, check))
+    elif mode == 'divide':
+        divides = [divide(game_class(), depth) for game_class in ENGINES]
+        print('{:>60}'.format('') + ''.join('{:>18}'.format(game_class.__name__) for game_class in ENGINES))
+        for move in sorted(set().union(*divides), key=repr):
+            print('{:>60}'.format(repr(move)) + ''.join('{:>18}'.format(str(counts.get(move))) for counts in divides))
+        print('{:>60}'.format('total') + ''.join('{:>18d}'.format(sum(counts.values())) for counts in divides))
+    elif mode == 'positions':
+        lines = random_moves(20, 12, seed=0)
+        differing = 0
+        for moves in lines:
+            mismatches = compare_divide(depth, moves)
+            if mismatches:
+                differing += 1
+                print('after {}:'.format(moves))
+                for move, counts in mismatches.items():
+                    print('    {}: {}'.format(move, counts))
+        print('{} of {} positions differ'.format(differing, len(lines)))
+    else:
+        sys.exit('unknown mode {}; use perft, divide, positions or turns'.format(mode))
@@ -1,85 +1,84 @@
-import os, pickle
+import os
 
 
-from checkers import CheckersRunner, Result
+from checkers import CheckersRunner
 from xsandos import XsAndOsRunner, NewellSimonAI
 from AIhub import *
-
-import cProfile
+from game_records import GameRecordWriter
+from learner_stats import CompactLearnerStats
+from tournament import Tally, run_tournament
 
 game = "xsandos"
+# What StateLearnerAI has learnt is kept here between runs
+knowledge_file = 'learner_stats_{}.bin'.format(game)
+# Set to play one game of AlphaBetaAI against RandomAI and print its search statistics
+report_search = False
 
-if game == "xsandos":
-    print('X - NewellSimonAI; O - StateLearnerAI')
-    for i in range(50):
-        b = XsAndOsRunner(NewellSimonAI, StateLearnerAI)
-        b.start_game(verbose=False)
-
-    print('\n\nX - StateLearnerAI; O - NewellSimonAI')
-    for i in range(30):
-        b = XsAndOsRunner(StateLearnerAI, NewellSimonAI)
-        b.start_game(verbose=False)
-
-    print('\n\nX - StateLearnerAI; O - StateLearnerAI')
-    for i in range(1):
-        b = XsAndOsRunner(StateLearnerAI, StateLearnerAI)
-        b.start_game(verbose=True)
-
-    print('\n\nX - RandomAI; O - StateLearnerAI')
-    for i in range(1):
-        b = XsAndOsRunner(RandomAI, StateLearnerAI)
-        b.start_game(verbose=True)
 
-        
 def test_run():
     b = CheckersRunner(Black_AIClass=AlphaBetaAI, White_AIClass=RandomAI)
+    b.record_search = True
     win = b.start_game(verbose=False)
-
-
-cProfile.run('test_run()')
-
-        
-if game == "checkers":
-    # checkers = Checkers(Black_AIClass=RandomAI, White_AIClass=StateLearnerAI)
-    # checkers.start_game(verbose=False)
-    black_class = AlphaBetaAI
-    white_class = RandomAI #StateLearnerAI
-    print('\n\nBlack: {}; White: {}'.format(black_class.__name__, white_class.__name__))
-    wins = 0
-    losses = 0
-    draws = 0
-
-    save_game_history = True
-
-    game_record_output_dir = 'games_dump'
-    if not os.path.exists(game_record_output_dir):
-        os.makedirs(game_record_output_dir)
-    game_histories = []
-    game_wins = []
-
-    for i in range(100):
-        if i % 10 == 0 and i > 0:
-            print(
-                "Stats: {:5.4f}-{:5.4f}-{:5.4f} (wins-draws-losses) ... {}".format(wins / i, draws / i, losses / i, i))
-
-            if save_game_history:
-                dump_filename = os.path.join(game_record_output_dir, 'dump_{}.pkl'.format(i))
-                with open(dump_filename, 'wb') as f:
-                    pickle.dump((game_wins, game_histories), f)
-                    game_wins = []
-                    game_histories = []
-
-        b = CheckersRunner(Black_AIClass=black_class, White_AIClass=white_class)
-        win = b.start_game(verbose=True)
-        if win == Result.BLACK:
-            wins += 1
-            winner = 'BLACK'
-        elif win == Result.WHITE:
-            losses += 1
-            winner = 'WHITE'
-        else:
-            draws += 1
-            winner = 'DRAW'
-        game_wins.append(winner)
-        game_histories.append(b.game_history())
-
+    return b.search_report()
+
+
+if __name__ == "__main__":
+    if os.path.exists(knowledge_file):
+        StateLearnerAI.use_stats(CompactLearnerStats.load(knowledge_file))
+
+    if game == "xsandos":
+        print('X - NewellSimonAI; O - StateLearnerAI')
+        for i in range(50):
+            b = XsAndOsRunner(NewellSimonAI, StateLearnerAI)
+            b.start_game(verbose=False)
+
+        print('\n\nX - StateLearnerAI; O - NewellSimonAI')
+        for i in range(30):
+            b = XsAndOsRunner(StateLearnerAI, NewellSimonAI)
+            b.start_game(verbose=False)
+
+        print('\n\nX - StateLearnerAI; O - StateLearnerAI')
+        for i in range(1):
+            b = XsAndOsRunner(StateLearnerAI, StateLearnerAI)
+            b.start_game(verbose=True)
+
+        print('\n\nX - RandomAI; O - StateLearnerAI')
+        for i in range(1):
+            b = XsAndOsRunner(RandomAI, StateLearnerAI)
+            b.start_game(verbose=True)
+
+        StateLearnerAI.stats.save(knowledge_file)
+
+    if report_search:
+        report = test_run()
+        for side, totals in report['totals'].items():
+            print('{}: {}'.format(side, ', '.join('{} {}'.format(name, value) for name, value in totals.items())))
+
+    if game == "checkers":
+        # checkers = Checkers(Black_AIClass=RandomAI, White_AIClass=StateLearnerAI)
+        # checkers.start_game(verbose=False)
+        black_class = AlphaBetaAI
+        white_class = RandomAI #StateLearnerAI
+        print('\n\nBlack: {}; White: {}'.format(black_class.__name__, white_class.__name__))
+        tally = Tally()
+        num_games = 100
+        workers = None  # one per CPU
+
+        save_game_history = True
+
+        game_record_output_dir = 'games_dump'
+        if not os.path.exists(game_record_output_dir):
+            os.makedirs(game_record_output_dir)
+        # Each game is appended to the record file as it finishes; see game_records.py
+        records = GameRecordWriter(os.path.join(game_record_output_dir, 'games.rec')) if save_game_history else None
+
+        # Games are played in parallel and come back as they finish
+        for record in run_tournament(black_class, white_class, range(num_games), workers=workers):
+            tally.add(record.winner)
+            if records:
+                records.write(record.winner, record.moves)
+
+            if tally.games % 10 == 0 or tally.games == num_games:
+                print(tally.summary())
+        if records:
+            records.close()
@@ -0,0 +1,318 @@
+"""Checkers endgame tablebases: the result of every position with few pieces under perfect play.
+
+    python tablebase.py [max_pieces] [path]
+
+builds tables for every mix of men and kings with up to max_pieces pieces (3 by default) and writes them to
+path.  Positions are grouped by material signature, the numbers of (black men, black kings, white men,
+white kings), and each signature's positions are numbered by ranking the squares of each kind of piece in
+turn with the combinatorial number system.  Each entry is one byte for the side to move: 0 for a draw,
+1 to 127 for a win in that many moves, 128 + n for a loss in n moves.  A whole multi-jump counts as one
+move, and the 100 turn limits in check_end_game are ignored.
+
+Tables are built by retrograde analysis on bitboard batches from checkers_batch: every position's
+successors are generated once, then sweeps resolve the losses and wins a move further from the end each
+time, so win distances are the shortest and loss distances the longest available.
+"""
+import sys
+
+import numpy as np
+
+from array_file import load_arrays, save_arrays
+from checkers import Colour
+from checkers_batch import BLACK, WHITE, BitboardBatch, unpack
+
+
+FILE_KIND = 'checkers_tablebase'
+DRAW = 0
+LOSS = 128
+MAX_DISTANCE = 127
+# Men never stand on the row they would be crowned on
+BLACK_MEN_SQUARES = 0xFFFFFFF0
+WHITE_MEN_SQUARES = 0x0FFFFFFF
+
+BINOMIAL = np.zeros((33, 33), dtype=np.int64)
+for _n in range(33):
+    BINOMIAL[_n, 0] = 1
+    for _k in range(1, _n + 1):
+        BINOMIAL[_n, _k] = BINOMIAL[_n - 1, _k - 1] + BINOMIAL[_n - 1, _k]
+
+BINOMIAL_ROWS = BINOMIAL.tolist()
+
+CHUNK = 1 << 15
+
+
+def signatures(max_pieces: int):
+    """Every (black men, black kings, white men, white kings) with both sides on the board, in build order.
+
+    A capture leaves fewer pieces and a crowning one man fewer, so each signature comes after those its
+    moves can lead to.
+    """
+    result = []
+    for total in range(2, max_pieces + 1):
+        for men in range(total + 1):
+            for black_men in range(men + 1):
+                for black_kings in range(total - men + 1):
+                    signature = (black_men, black_kings, men - black_men, total - men - black_kings)
+                    if signature[0] + signature[1] and signature[2] + signature[3]:
+                        result.append(signature)
+    return result
+
+
+def signature_size(signature):
+    size = 1
+    free = 32
+    for count in signature:
+        size *= int(BINOMIAL[free, count])
+        free -= count
+    return size
+
+
+def _piece_sets(black, white, kings):
+    return black & ~kings, black & kings, white & ~kings, white & kings
+
+
+def position_index(signature, black, white, kings):
+    """Index within signature of each position given as arrays of bitboards."""
+    index = np.zeros(len(black), dtype=np.int64)
+    occupied = np.zeros((len(black), 32), dtype=bool)
+    free = 32
+    for count, pieces in zip(signature, _piece_sets(black, white, kings)):
+        squares = unpack(pieces)
+        # Each piece's square, counted among the squares the earlier kinds of piece left free
+        free_below = np.cumsum(~occupied, axis=1) - ~occupied
+        order = np.cumsum(squares, axis=1)
+        rank = np.where(squares, BINOMIAL[free_below, order], 0).sum(axis=1)
+        index = index * BINOMIAL[free, count] + rank
+        occupied |= squares
+        free -= count
+    return index
+
+
+def _single_index(signature, black: int, white: int, kings: int):
+    # position_index for one position, without the array overhead
+    index = 0
+    occupied = 0
+    free = 32
+    for count, pieces in zip(signature, _piece_sets(black, white, kings)):
+        rank = 0
+        order = 0
+        remaining = pieces
+        while remaining:
+            low_bit = remaining & -remaining
+            square = low_bit.bit_length() - 1
+            order += 1
+            rank += BINOMIAL_ROWS[square - bin(occupied & (low_bit - 1)).count('1')][order]
+            remaining ^= low_bit
+        occupied |= pieces
+        index = index * BINOMIAL_ROWS[free][count] + rank
+        free -= count
+    return index
+
+
+def positions(signature, indices):
+    """The (black, white, kings) bitboards of each index of signature; the inverse of position_index."""
+    ranks = []
+    free = 32
+    sizes = []
+    for count in signature:
+        sizes.append(int(BINOMIAL[free, count]))
+        free -= count
+    remainder = np.asarray(indices, dtype=np.int64)
+    for size in reversed(sizes):
+        ranks.append(remainder % size)
+        remainder = remainder // size
+    ranks.reverse()
+
+    occupied = np.zeros((len(remainder), 32), dtype=bool)
+    piece_sets = []
+    for count, rank in zip(signature, ranks):
+        rank = rank.copy()
+        free_index = np.cumsum(~occupied, axis=1) - 1
+        squares = np.zeros_like(occupied)
+        for order in range(count, 0, -1):
+            # The largest c with C(c, order) <= rank is the order'th piece's place among the free squares
+            c = np.searchsorted(BINOMIAL[:, order], rank, side='right') - 1
+            rank -= BINOMIAL[c, order]
+            squares |= ~occupied & (free_index == c[:, None])
+        piece_sets.append(squares)
+        occupied |= squares
+    bits = np.uint32(1) << np.arange(32, dtype=np.uint32)
+    black_men, black_kings, white_men, white_kings = [np.bitwise_or.reduce(np.where(s, bits, np.uint32(0)), axis=1)
+                                                      for s in piece_sets]
+    return black_men | black_kings, white_men | white_kings, black_kings | white_kings
+
+
+def successors(black, white, kings, sides):
+    """Every position one whole move on from each position, as (parents, black, white, kings) arrays.
+
+    A multi-jump is followed to its end, so the side to move always changes.  parents gives the index of
+    the position each successor came from.
+    """
+    batch = BitboardBatch.from_positions(black, white, kings, sides)
+    parents = np.arange(len(black))
+    found = []
+    while len(batch):
+        legal, _ = batch.legal_moves()
+        games, squares, directions = np.nonzero(legal)
+        batch = BitboardBatch.from_positions(batch.black[games], batch.white[games], batch.kings[games],
+                                             batch.sides[games], batch.pending[games])
+        parents = parents[games]
+        batch.play(squares, directions)
+        finished = batch.pending < 0
+        found.append((parents[finished], batch.black[finished], batch.white[finished], batch.kings[finished]))
+        carry_on = ~finished
+        batch = BitboardBatch.from_positions(batch.black[carry_on], batch.white[carry_on], batch.kings[carry_on],
+                                             batch.sides[carry_on], batch.pending[carry_on])
+        parents = parents[carry_on]
+    return tuple(np.concatenate(arrays) for arrays in zip(*found))
+
+
+def _count(bits):
+    return unpack(bits).sum(axis=1)
+
+
+class Tablebase:
+    """Tables written by build_tablebase, memory-mapped read-only so processes share them.
+
+    Pickles as its path, so it can be handed to worker processes cheaply.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        meta, arrays = load_arrays(path, FILE_KIND)
+        self.max_pieces = meta['max_pieces']
+        self._tables = {tuple(int(count) for count in name.split('_')): table for name, table in arrays.items()}
+        self.probes = 0
+        self.hits = 0
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def probe(self, black: int, white: int, kings: int, side: Colour):
+        """(result, distance) for the side to move, result 1 win, 0 draw, -1 loss; None if not covered."""
+        self.probes += 1
+        signature = (bin(black & ~kings).count('1'), bin(black & kings).count('1'),
+                     bin(white & ~kings).count('1'), bin(white & kings).count('1'))
+        table = self._tables.get(signature)
+        if table is None:
+            return None
+        code = int(table[0 if side == Colour.BLACK else 1, _single_index(signature, black, white, kings)])
+        self.hits += 1
+        return decode(code)
+
+    def probe_game(self, game):
+        """probe() for a game's position, or None part way through a multi-jump or outside the tables."""
+        if game.piece_to_move is not None:
+            return None
+        black, white, kings = game.to_bitboards()
+        if bin(black | white).count('1') > self.max_pieces:
+            return None
+        return self.probe(black, white, kings, game.next_player)
+
+
+def decode(code: int):
+    if code == DRAW:
+        return 0, 0
+    if code < LOSS:
+        return 1, code
+    return -1, code - LOSS
+
+
+def _solve_signature(signature, solved, verbose=False):
+    size = signature_size(signature)
+    codes = np.zeros(2 * size, dtype=np.uint8)
+    # Each edge is a move from a parent position (side * size + index) to a child, which is either in this
+    # signature (internal, with its flat index) or already solved (external, with its code)
+    edge_parents, edge_targets, edge_codes = [], [], []
+    valid = np.zeros(2 * size, dtype=bool)
+    for side_index, side in enumerate((BLACK, WHITE)):
+        for start in range(0, size, CHUNK):
+            indices = np.arange(start, min(size, start + CHUNK))
+            black, white, kings = positions(signature, indices)
+            legal = ((black & ~kings & ~np.uint32(BLACK_MEN_SQUARES)) == 0) & \
+                    ((white & ~kings & ~np.uint32(WHITE_MEN_SQUARES)) == 0)
+            indices, black, white, kings = indices[legal], black[legal], white[legal], kings[legal]
+            valid[side_index * size + indices] = True
+            parents, child_black, child_white, child_kings = successors(black, white, kings,
+                                                                        np.full(len(black), side, dtype=np.int8))
+            parents = side_index * size + indices[parents]
+            targets = np.full(len(parents), -1, dtype=np.int64)
+            child_codes = np.zeros(len(parents), dtype=np.uint8)
+            child_signatures = np.stack([_count(child_black & ~child_kings), _count(child_black & child_kings),
+                                         _count(child_white & ~child_kings), _count(child_white & child_kings)],
+                                        axis=1)
+            child_side_index = 1 - side_index
+            for child_signature in {tuple(row) for row in child_signatures.tolist()}:
+                group = (child_signatures == child_signature).all(axis=1)
+                mover_pieces = child_signature[2:] if child_side_index == 1 else child_signature[:2]
+                if not sum(mover_pieces):
+                    # The last piece was taken, so the side to move has lost
+                    child_codes[group] = LOSS
+                    continue
+                child_index = position_index(child_signature, child_black[group], child_white[group],
+                                             child_kings[group])
+                if child_signature == signature:
+                    targets[group] = child_side_index * size + child_index
+                else:
+                    child_codes[group] = solved[child_signature][child_side_index, child_index]
+            edge_parents.append(parents)
+            edge_targets.append(targets)
+            edge_codes.append(child_codes)
+    parents = np.concatenate(edge_parents)
+    targets = np.concatenate(edge_targets)
+    external_codes = np.concatenate(edge_codes)
+    internal = targets >= 0
+    degree = np.bincount(parents, minlength=2 * size)
+
+    resolved = ~valid
+    # A position without a move is lost straight away
+    lost_now = valid & (degree == 0)
+    codes[lost_now] = LOSS
+    resolved |= lost_now
+    distance = 1
+    last_external = max((decode(int(code))[1] for code in np.unique(external_codes)), default=0)
+    while True:
+        child_codes = np.where(internal, codes[np.maximum(targets, 0)], external_codes)
+        child_resolved = np.where(internal, resolved[np.maximum(targets, 0)], True)
+        child_lost = child_resolved & (child_codes >= LOSS)
+        child_won = child_resolved & (child_codes > DRAW) & (child_codes < LOSS)
+        child_distance = np.where(child_lost, child_codes.astype(np.int64) - LOSS, child_codes)
+        # Win in distance by moving to a position lost in distance - 1
+        wins = np.bincount(parents[child_lost & (child_distance == distance - 1)], minlength=2 * size) > 0
+        # Lose in distance when every move leads to a win in distance - 1 or less
+        won_children = np.bincount(parents[child_won & (child_distance <= distance - 1)], minlength=2 * size)
+        losses = (won_children == degree) & ~wins
+        new_wins = wins & ~resolved
+        new_losses = losses & ~resolved
+        if distance > MAX_DISTANCE:
+            raise ValueError('Tablebase distance over {} moves in {}'.format(MAX_DISTANCE, signature))
+        codes[new_wins] = distance
+        codes[new_losses] = LOSS + distance
+        resolved |= new_wins | new_losses
+        if not new_wins.any() and not new_losses.any() and distance > last_external + 1:
+            break
+        distance += 1
+    if verbose:
+        wins = (codes > DRAW) & (codes < LOSS)
+        losses = codes >= LOSS
+        longest = max(int(codes[wins].max(initial=0)), int(codes[losses].max(initial=LOSS)) - LOSS)
+        print('{}: {} positions, {} wins, {} losses, {} draws, longest {} moves'.format(
+            signature, valid.sum(), wins.sum(), losses.sum(), valid.sum() - wins.sum() - losses.sum(), longest))
+    return codes.reshape(2, size)
+
+
+def build_tablebase(path: str, max_pieces: int = 3, verbose: bool = False):
+    """Solve every signature with up to max_pieces pieces and write the tables to path."""
+    solved = {}
+    for signature in signatures(max_pieces):
+        solved[signature] = _solve_signature(signature, solved, verbose)
+    save_arrays(path, FILE_KIND, {'_'.join(str(count) for count in signature): table
+                                  for signature, table in solved.items()}, {'max_pieces': max_pieces})
+
+
+if __name__ == '__main__':
+    max_pieces = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    path = sys.argv[2] if len(sys.argv) > 2 else 'tablebase_{}.bin'.format(max_pieces)
+    build_tablebase(path, max_pieces, verbose=True)
@@ -0,0 +1,81 @@
+"""Checkers and BitboardCheckers should play exactly the same game, with the same position keys."""
+import random
+
+from checkers import Colour
+from checkers_bitboard import BitboardCheckers
+from perft import ENGINES, START_COUNTS, perft
+from zobrist import swap_halves
+
+
+def _state(game):
+    piece = game.piece_to_move
+    return (game.to_bitboards(), game.next_player, game.turn_count, game.turns_since_last_piece_taken,
+            None if piece is None else tuple(piece.position))
+
+
+def _random_games(num_games: int, max_plies: int, seed: int, game_classes=ENGINES):
+    """Yield a game per engine at every position of seeded random games played on all of them at once."""
+    rng = random.Random(seed)
+    for _ in range(num_games):
+        games = [game_class() for game_class in game_classes]
+        for _ in range(max_plies):
+            yield games
+            if games[0].check_end_game():
+                break
+            moves = sorted(games[0].possible_moves(games[0].next_player), key=repr)
+            move = rng.choice(moves)
+            for game in games:
+                game.make_move(move)
+
+
+def _flipped(game: BitboardCheckers):
+    """The position with the board turned round and the colours swapped, square s going to 31 - s."""
+    def turn(bits):
+        return int('{:032b}'.format(bits)[::-1], 2)
+    flipped = game.copy(include_history=False)
+    flipped._black, flipped._white, flipped._kings = turn(game._white), turn(game._black), turn(game._kings)
+    flipped._next_player = game.next_player.other_colour
+    if game._piece_to_move is not None:
+        flipped._piece_to_move = 31 - game._piece_to_move
+    flipped._position_key = flipped._compute_position_key()
+    return flipped
+
+
+def test_perft():
+    for game_class in ENGINES:
+        assert perft(game_class(), 4) == START_COUNTS[4]
+
+
+def test_engines_agree_over_random_games():
+    for game, bitboard_game in _random_games(8, 120, seed=0):
+        assert _state(game) == _state(bitboard_game)
+        assert game.check_end_game() == bitboard_game.check_end_game()
+        moves = game.possible_moves(game.next_player)
+        assert sorted(moves, key=repr) == sorted(bitboard_game.possible_moves(bitboard_game.next_player), key=repr)
+        for move in moves:
+            for each in (game, bitboard_game):
+                before = _state(each)
+                each.undo(each.apply(move))
+                assert _state(each) == before
+        assert game.game_history == bitboard_game.game_history
+
+
+def test_position_keys_over_random_games():
+    for game, bitboard_game in _random_games(4, 120, seed=1):
+        assert game.position_key == bitboard_game.position_key
+        for each in (game, bitboard_game):
+            key = each.position_key
+            assert key == each._compute_position_key()
+            for move in each.possible_moves(each.next_player):
+                undo_token = each.apply(move)
+                assert each.position_key == each._compute_position_key()
+                each.undo(undo_token)
+                assert each.position_key == key
+
+
+def test_colour_flip_keys():
+    for (game,) in _random_games(20, 120, seed=2, game_classes=[BitboardCheckers]):
+        flipped = _flipped(game)
+        assert flipped.position_key == swap_halves(game.position_key)
+        assert flipped.canonical_key(Colour.BLACK) == game.canonical_key(Colour.WHITE)
+        assert len(flipped.possible_moves(flipped.next_player)) == len(game.possible_moves(game.next_player))
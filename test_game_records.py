@@ -0,0 +1,50 @@
+"""Games written to a record file should read back exactly, even after a run died part way through one."""
+import os
+
+from AIhub import RandomAI
+from checkers import Checkers
+from checkers_bitboard import BitboardCheckers
+from game_records import INDEX_DTYPE, GameRecordReader, GameRecordWriter, index_path
+from tournament import play_game
+
+
+def _games(num_games: int):
+    return [play_game(RandomAI, RandomAI, seed, BitboardCheckers) for seed in range(num_games)]
+
+
+def test_games_read_back(tmp_path):
+    path = str(tmp_path / 'games.rec')
+    games = _games(6)
+    with GameRecordWriter(path) as writer:
+        for winner, _, moves in games:
+            writer.write(winner, moves)
+    for game_class in (Checkers, BitboardCheckers):
+        with GameRecordReader(path, game_class) as records:
+            assert records.results == [winner for winner, _, _ in games]
+            assert records.lengths.tolist() == [len(moves) for _, _, moves in games]
+            for game_number, (_, history, moves) in enumerate(games):
+                assert records.history(game_number) == history
+                assert records.moves(game_number) == moves
+
+
+def test_torn_index_entry(tmp_path):
+    path = str(tmp_path / 'games.rec')
+    games = _games(4)
+    with GameRecordWriter(path) as writer:
+        for winner, _, moves in games:
+            writer.write(winner, moves)
+    # A run that died while writing the last game's index entry
+    with open(index_path(path), 'r+b') as f:
+        f.truncate(os.path.getsize(index_path(path)) - INDEX_DTYPE.itemsize // 2)
+    with GameRecordReader(path) as records:
+        assert len(records) == len(games) - 1
+        assert records.history(len(games) - 2) == games[-2][1]
+
+    # The next run drops the torn entry and carries on after it
+    winner, _, moves = games[-1]
+    with GameRecordWriter(path) as writer:
+        writer.write(winner, moves)
+    with GameRecordReader(path) as records:
+        assert records.results == [winner for winner, _, _ in games]
+        for game_number, (_, history, _) in enumerate(games):
+            assert records.history(game_number) == history
@@ -0,0 +1,23 @@
+"""StateLearnerAI should learn to hold NewellSimonAI to a draw."""
+import random
+from contextlib import redirect_stdout
+from io import StringIO
+
+from AIhub import StateLearnerAI
+from learner_stats import CompactLearnerStats, DictLearnerStats
+from xsandos import NewellSimonAI, Result, XsAndOsRunner
+
+
+def _play(x_player, o_player, num_games: int):
+    # XsAndOsRunner prints every result
+    with redirect_stdout(StringIO()):
+        return [XsAndOsRunner(x_player, o_player).start_game() for _ in range(num_games)]
+
+
+def test_learner_draws_against_newell_simon():
+    for stats in (CompactLearnerStats(), DictLearnerStats()):
+        StateLearnerAI.use_stats(stats)
+        random.seed(0)
+        results = _play(NewellSimonAI, StateLearnerAI, 300)
+        assert results.count(Result.DRAW) >= 250
+        assert results[-100:].count(Result.DRAW) == 100
@@ -0,0 +1,98 @@
+"""Tablebase indexing should round-trip and its results should agree with searching the positions out."""
+import random
+
+import numpy as np
+
+from checkers import Colour
+from checkers_bitboard import BitboardCheckers
+from tablebase import (BLACK_MEN_SQUARES, WHITE_MEN_SQUARES, Tablebase, _single_index, _solve_signature,
+                       build_tablebase, decode, position_index, positions, signature_size, signatures)
+
+
+def _game(black: int, white: int, kings: int, side: Colour):
+    game = BitboardCheckers()
+    game._black, game._white, game._kings = black, white, kings
+    game._next_player = side
+    game._position_key = game._compute_position_key()
+    return game
+
+
+def _whole_moves(game):
+    """The position after each whole move, a multi-jump followed to its end."""
+    side = game.next_player
+    for move in game.possible_moves(side):
+        child = game.copy(include_history=False)
+        child.apply(move)
+        if child.next_player == side:
+            yield from _whole_moves(child)
+        else:
+            yield child
+
+
+def _search(game, depth: int):
+    """(result, distance) as the tablebase gives it if the game is decided within depth moves, else None."""
+    children = list(_whole_moves(game))
+    if not children:
+        return -1, 0
+    if depth == 0:
+        return None
+    outcomes = [_search(child, depth - 1) for child in children]
+    lost = [outcome[1] for outcome in outcomes if outcome is not None and outcome[0] == -1]
+    if lost:
+        return 1, min(lost) + 1
+    if all(outcome is not None and outcome[0] == 1 for outcome in outcomes):
+        return -1, max(outcome[1] for outcome in outcomes) + 1
+    return None
+
+
+def _legal_positions(signature):
+    indices = np.arange(signature_size(signature))
+    black, white, kings = positions(signature, indices)
+    legal = (((black & ~kings & ~np.uint32(BLACK_MEN_SQUARES)) == 0) &
+             ((white & ~kings & ~np.uint32(WHITE_MEN_SQUARES)) == 0))
+    return indices[legal], black[legal], white[legal], kings[legal]
+
+
+def _check_probes(signature, table, depth: int, num_probes: int, seed: int):
+    """Search out some positions decided within depth moves and some that aren't, and compare."""
+    rng = random.Random(seed)
+    indices, black, white, kings = _legal_positions(signature)
+    for side_index, side in enumerate((Colour.BLACK, Colour.WHITE)):
+        outcomes = [decode(int(code)) for code in table[side_index, indices]]
+        decided = [i for i, (result, distance) in enumerate(outcomes) if result and distance <= depth]
+        undecided = [i for i, (result, distance) in enumerate(outcomes) if not result or distance > depth]
+        for i in rng.sample(decided, num_probes) + rng.sample(undecided, num_probes):
+            game = _game(int(black[i]), int(white[i]), int(kings[i]), side)
+            expected = outcomes[i] if i in decided else None
+            assert _search(game, depth) == expected, (signature, side, outcomes[i])
+
+
+def test_index_round_trip():
+    for signature in signatures(3):
+        indices = np.arange(signature_size(signature))
+        black, white, kings = positions(signature, indices)
+        assert not (black & white).any()
+        assert (position_index(signature, black, white, kings) == indices).all()
+        for i in indices[::97].tolist():
+            assert _single_index(signature, int(black[i]), int(white[i]), int(kings[i])) == i
+
+
+def test_one_against_one(tmp_path):
+    path = str(tmp_path / 'tablebase_2.bin')
+    build_tablebase(path, max_pieces=2)
+    tablebase = Tablebase(path)
+    for signature in signatures(2):
+        table = tablebase._tables[signature]
+        _check_probes(signature, table, depth=5, num_probes=10, seed=0)
+        # probe_game reads the same entries from the file
+        indices, black, white, kings = _legal_positions(signature)
+        for i in range(0, len(indices), 101):
+            game = _game(int(black[i]), int(white[i]), int(kings[i]), Colour.WHITE)
+            assert tablebase.probe_game(game) == decode(int(table[1, indices[i]]))
+
+
+def test_two_kings_against_one():
+    solved = {}
+    for signature in [(0, 1, 0, 1), (0, 2, 0, 1)]:
+        solved[signature] = _solve_signature(signature, solved)
+    _check_probes((0, 2, 0, 1), solved[(0, 2, 0, 1)], depth=3, num_probes=10, seed=1)
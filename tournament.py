@@ -0,0 +1,74 @@
+import os
+import random
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from checkers import CheckersRunner, Result
+
+
+GameRecord = namedtuple('GameRecord', ['index', 'seed', 'winner', 'history', 'moves'])
+
+WINNER_NAMES = {Result.BLACK: 'BLACK', Result.WHITE: 'WHITE', Result.DRAW: 'DRAW'}
+
+
+def play_game(black_class, white_class, seed, game_class=None):
+    """Play one seeded game of checkers and return the winner's name, the board history and the moves."""
+    random.seed(seed)
+    runner = CheckersRunner(Black_AIClass=black_class, White_AIClass=white_class, game_class=game_class)
+    result = runner.start_game(verbose=False)
+    return WINNER_NAMES[result], runner.game_history(), runner.move_history()
+
+
+def _play_game(index, black_class, white_class, seed, game_class):
+    winner, history, moves = play_game(black_class, white_class, seed, game_class)
+    return GameRecord(index, seed, winner, history, moves)
+
+
+def run_tournament(black_class, white_class, seeds, workers=None, game_class=None, initializer=None, initargs=()):
+    """Play one game per seed across a process pool, yielding a GameRecord as each game finishes.
+
+    Records come back in the order games finish, not seed order; GameRecord.index is the seed's position.
+    The AI classes (or functools.partial wrappers of them) must be importable by the workers.  Only a few
+    games per worker are queued at a time, so seeds may be a long or lazy iterable.
+    initializer/initargs are passed to the pool, e.g. to attach shared learner statistics.
+    """
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs) as executor:
+        max_pending = 4 * workers
+        seeds = enumerate(seeds)
+        pending = set()
+        while True:
+            for index, seed in seeds:
+                pending.add(executor.submit(_play_game, index, black_class, white_class, seed, game_class))
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+class Tally:
+    """Win/draw/loss counts from black's point of view, as run_game.py reports them."""
+    def __init__(self):
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def add(self, winner: str):
+        if winner == 'BLACK':
+            self.wins += 1
+        elif winner == 'WHITE':
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    def summary(self):
+        games = max(self.games, 1)
+        return "Stats: {:5.4f}-{:5.4f}-{:5.4f} (wins-draws-losses) ... {}".format(
+            self.wins / games, self.draws / games, self.losses / games, self.games)
@@ -0,0 +1,77 @@
+from enum import Enum
+
+
+class Bound(Enum):
+    EXACT = 1
+    LOWER = 2  # the search failed high, the true value is at least this
+    UPPER = 3  # the search failed low, the true value is at most this
+
+
+class Replacement(Enum):
+    DEPTH_PREFERRED = 1
+    ALWAYS = 2
+
+
+class TranspositionTable:
+    """Fixed-size table of search results keyed by Zobrist position key.
+
+    Each slot holds the key, search depth, value, bound type and best move of one position, stored in
+    parallel lists so the table is allocated once and never grows.  The slot is picked by the low bits of
+    the key.  With DEPTH_PREFERRED a slot is only overwritten by a search at least as deep, or by anything
+    once the entry is left over from an earlier search; with ALWAYS the newest result wins.
+    """
+    # Rough CPython cost of one slot: five list pointers plus the boxed key and value
+    BYTES_PER_ENTRY = 100
+
+    def __init__(self, max_megabytes: float = 16, replacement: Replacement = Replacement.DEPTH_PREFERRED):
+        size = 1
+        while size * 2 * self.BYTES_PER_ENTRY <= max_megabytes * 1024 * 1024:
+            size *= 2
+        self._mask = size - 1
+        self._replacement = replacement
+        self.clear()
+
+    def __len__(self):
+        return self._mask + 1
+
+    def new_search(self):
+        # Entries from earlier searches stay usable but may be replaced by anything
+        self._generation += 1
+
+    def lookup(self, key: int):
+        """Return (depth, value, bound, best_move) for key, or None if it is not in the table."""
+        index = key & self._mask
+        if self._keys[index] != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._depths[index], self._values[index], self._bounds[index], self._moves[index]
+
+    def store(self, key: int, depth: int, value: float, bound: Bound, best_move=None):
+        index = key & self._mask
+        if (self._replacement == Replacement.DEPTH_PREFERRED and self._keys[index] is not None and
+                self._keys[index] != key and self._generations[index] == self._generation and
+                self._depths[index] > depth):
+            return
+        self._keys[index] = key
+        self._depths[index] = depth
+        self._values[index] = value
+        self._bounds[index] = bound
+        self._moves[index] = best_move
+        self._generations[index] = self._generation
+        self.stores += 1
+
+    def clear(self):
+        """Empty every slot and zero the counters, leaving the table as it was when new."""
+        size = self._mask + 1
+        self._keys = [None] * size
+        self._depths = [0] * size
+        self._values = [0.] * size
+        self._bounds = [None] * size
+        self._moves = [None] * size
+        self._generations = [0] * size
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.cutoffs = 0
+        self.stores = 0
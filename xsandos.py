@@ -1,8 +1,12 @@
+import os
+import random
+from collections import namedtuple
 import numpy as np
 from enum import Enum
-from copy import deepcopy
 
+from array_file import load_arrays, save_arrays
 from game import Game, GameRunner
+from zobrist import ZobristKeys
 
 
 class Result(Enum):
@@ -25,21 +29,50 @@ class Square(Enum):
 
     @property
     def other_side(self):
-        return Square.Xs if self.value == Square.Os else Square.Os
+        return Square.Xs if self == Square.Os else Square.Os
 
     @property
     def side_to_result(self):
-        return Result.Xs if self.value == Square.Xs else Square.Os
+        return Result.Xs if self == Square.Xs else Result.Os
+
+
+# Where each square 3 * row + column goes under each rotation and reflection of the board, identity first
+SYMMETRIES = [[3 * r + c for r, c in (image(row, col) for row in range(3) for col in range(3))]
+              for image in (lambda r, c: (r, c), lambda r, c: (c, 2 - r), lambda r, c: (2 - r, 2 - c),
+                            lambda r, c: (2 - c, r), lambda r, c: (r, 2 - c), lambda r, c: (2 - r, c),
+                            lambda r, c: (c, r), lambda r, c: (2 - c, 2 - r))]
+
+# Keyed by side and the square's index 3 * row + column
+XSANDOS_ZOBRIST = ZobristKeys(9, [Square.Xs, Square.Os], [Square.Xs, Square.Os], seed=3)
+
+# For each side and square, the piece's key in each symmetric image of the board
+SYMMETRIC_PIECE_KEYS = {side: [tuple(XSANDOS_ZOBRIST.pieces[side][symmetry[square]] for symmetry in SYMMETRIES)
+                               for square in range(9)]
+                        for side in (Square.Xs, Square.Os)}
+SYMMETRIC_PIECE_KEY_ARRAYS = {side: np.array(keys, dtype=np.uint64) for side, keys in SYMMETRIC_PIECE_KEYS.items()}
+
+# A board's code is the base 3 number with digit 3 * row + column 0 for blank, 1 for Xs and 2 for Os
+NUM_BOARD_CODES = 3 ** 9
+BOARD_CODE_DIGITS = {Square.Xs: [3 ** square for square in range(9)],
+                     Square.Os: [2 * 3 ** square for square in range(9)]}
 
 
 class XsAndOs(Game):
+    zobrist = XSANDOS_ZOBRIST
+
     def __init__(self):
         super().__init__()
         self._board = [[Square.BLANK, Square.BLANK, Square.BLANK],
                        [Square.BLANK, Square.BLANK, Square.BLANK],
                        [Square.BLANK, Square.BLANK, Square.BLANK]]
         self._next_player = Square.Xs
+        self._position_key = self.zobrist.side_to_move[Square.Xs]
+        # The pieces' part of the key of each symmetric image of the board, kept up to date by apply/undo
+        self._board_keys = (0,) * len(SYMMETRIES)
+        self._board_code = 0
         self.game_history = []
+        self.key_history = []
+        self.canonical_key_history = []
         self.add_state_to_game_history()
 
     def check_end_game(self):
@@ -54,8 +87,48 @@ class XsAndOs(Game):
         return False
 
     def make_move(self, move):
+        self.apply(move)
+        self.add_state_to_game_history()
+
+    def apply(self, move):
+        """Make move in place and return a token that undo() takes to restore the previous state."""
+        undo_token = (move[MoveXs.ROW], move[MoveXs.COLUMN], self._next_player, self._position_key, self._board_keys,
+                      self._board_code)
         self._board[move[MoveXs.ROW]][move[MoveXs.COLUMN]] = move[MoveXs.SIDE]
+        self._position_key ^= (self.zobrist.pieces[move[MoveXs.SIDE]][3 * move[MoveXs.ROW] + move[MoveXs.COLUMN]] ^
+                               self.zobrist.side_to_move[self._next_player] ^
+                               self.zobrist.side_to_move[self._next_player.other_side])
+        piece_keys = SYMMETRIC_PIECE_KEYS[move[MoveXs.SIDE]][3 * move[MoveXs.ROW] + move[MoveXs.COLUMN]]
+        self._board_keys = tuple(key ^ piece_key for key, piece_key in zip(self._board_keys, piece_keys))
+        self._board_code += BOARD_CODE_DIGITS[move[MoveXs.SIDE]][3 * move[MoveXs.ROW] + move[MoveXs.COLUMN]]
         self._next_player = self.next_player.other_side
+        return undo_token
+
+    def undo(self, undo_token):
+        row, column, self._next_player, self._position_key, self._board_keys, self._board_code = undo_token
+        self._board[row][column] = Square.BLANK
+
+    @property
+    def board_code(self):
+        return self._board_code
+
+    def _canonical_position_key(self):
+        # The smallest key over the symmetric images of the board
+        return min(self._board_keys) ^ self.zobrist.side_to_move[self._next_player]
+
+    def canonical_key(self, side: Square):
+        return self._canonical_position_key() ^ self.zobrist.owner[side]
+
+    def canonical_history(self, side: Square):
+        return [key ^ self.zobrist.owner[side] for key in self.canonical_key_history]
+
+    def child_keys(self, moves: list, side: Square):
+        # Every move is a piece of the side to move on an empty square, so all the children are one array op
+        squares = np.fromiter((3 * move[MoveXs.ROW] + move[MoveXs.COLUMN] for move in moves), dtype=np.intp,
+                              count=len(moves))
+        board_keys = np.array(self._board_keys, dtype=np.uint64) ^ SYMMETRIC_PIECE_KEY_ARRAYS[self._next_player][squares]
+        return board_keys.min(axis=1) ^ np.uint64(self.zobrist.side_to_move[self._next_player.other_side] ^
+                                                  self.zobrist.owner[side])
 
     def check_move(self, move):
         return self._board[move[MoveXs.ROW]][move[MoveXs.COLUMN]] == Square.BLANK
@@ -65,9 +138,16 @@ class XsAndOs(Game):
         for i in range(len(game_copy._board)):
             game_copy._board[i] = self._board[i][:]
         game_copy._next_player = self._next_player
+        game_copy._position_key = self._position_key
+        game_copy._board_keys = self._board_keys
+        game_copy._board_code = self._board_code
         game_copy.game_history = []
+        game_copy.key_history = []
+        game_copy.canonical_key_history = []
         if include_history:
-            game_copy.game_history = deepcopy(self.game_history)
+            game_copy.game_history = self.game_history[:]
+            game_copy.key_history = self.key_history[:]
+            game_copy.canonical_key_history = self.canonical_key_history[:]
         return game_copy
 
     # TODO: If sides get normalised these could be in the super class
@@ -113,6 +193,8 @@ class XsAndOs(Game):
                 board_list.append(position_char)
         board_string = ''.join(board_list)
         self.game_history.append(board_string)
+        self.key_history.append(self._position_key)
+        self.canonical_key_history.append(self._canonical_position_key())
 
 
 class XsAndOsRunner(GameRunner):
@@ -133,7 +215,8 @@ class XsAndOsRunner(GameRunner):
             valid_move = False
             move = None
             while not valid_move:
-                print(self._game.next_player)
+                if verbose:
+                    print(self._game.next_player)
                 move = self._ais[self._game.next_player].move()
                 valid_move = True if self._game.check_move(move) else False
                 if not valid_move:
@@ -315,3 +398,137 @@ class NewellSimonAI:
 
     def loss(self):
         pass
+
+
+# The solved game, built once and cached next to this module
+PERFECT_PLAY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'xsandos_perfect_play.bin')
+
+# Indexed by board code.  values is the result under perfect play, 1 for Xs, -1 for Os and 0 for a draw;
+# distances the number of moves left with the winner hurrying and the loser holding out; best_moves the
+# square a perfect player picks; optimal_moves a bit per square that keeps the value.  Unreachable boards
+# are left zero.
+PerfectPlayTable = namedtuple('PerfectPlayTable', ['values', 'distances', 'best_moves', 'optimal_moves'])
+
+WIN_LINES = ((0, 1, 2), (3, 4, 5), (6, 7, 8), (0, 3, 6), (1, 4, 7), (2, 5, 8), (0, 4, 8), (2, 4, 6))
+
+_perfect_play = None
+
+
+def solve_perfect_play():
+    """Minimax over every board reachable from the empty one."""
+    table = PerfectPlayTable(np.zeros(NUM_BOARD_CODES, dtype=np.int8), np.zeros(NUM_BOARD_CODES, dtype=np.int8),
+                             np.full(NUM_BOARD_CODES, -1, dtype=np.int8), np.zeros(NUM_BOARD_CODES, dtype=np.uint16))
+    solved = np.zeros(NUM_BOARD_CODES, dtype=bool)
+    board = [0] * 9
+
+    def solve(code, mover):
+        # mover is the digit of the side to move, 1 for Xs and 2 for Os
+        if not solved[code]:
+            solved[code] = True
+            for a, b, c in WIN_LINES:
+                if board[a] and board[a] == board[b] == board[c]:
+                    table.values[code] = 1 if board[a] == 1 else -1
+                    return
+            if all(board):
+                return
+            sign = 1 if mover == 1 else -1
+            children = []
+            for square in range(9):
+                if board[square]:
+                    continue
+                board[square] = mover
+                child = code + mover * 3 ** square
+                solve(child, 3 - mover)
+                board[square] = 0
+                children.append((square, sign * int(table.values[child]), int(table.distances[child])))
+            best = max(value for _, value, _ in children)
+            # Of the moves that keep the value, win as fast and lose as slowly as possible
+            square, value, distance = max(children, key=lambda child: (child[1], -child[2] if best > 0 else child[2]))
+            table.values[code] = sign * value
+            table.distances[code] = distance + 1
+            table.best_moves[code] = square
+            table.optimal_moves[code] = sum(1 << square for square, value, _ in children if value == best)
+
+    solve(0, 1)
+    return table
+
+
+def perfect_play_table():
+    """The solved game, loaded from PERFECT_PLAY_FILE the first time it is needed and built if it is missing."""
+    global _perfect_play
+    if _perfect_play is None:
+        if not os.path.exists(PERFECT_PLAY_FILE):
+            table = solve_perfect_play()
+            try:
+                save_arrays(PERFECT_PLAY_FILE, 'xsandos_perfect_play', table._asdict())
+            except OSError:
+                # Somewhere read-only; keep the table built in memory
+                _perfect_play = table
+                return _perfect_play
+        _, arrays = load_arrays(PERFECT_PLAY_FILE, 'xsandos_perfect_play')
+        _perfect_play = PerfectPlayTable(**arrays)
+    return _perfect_play
+
+
+class PerfectPlayAI:
+    """Plays the solved game by looking up the board in the perfect play table, so it never loses."""
+    def __init__(self, game: XsAndOs, side: Square, other_side: Square):
+        self._game = game
+        self._side = side
+        self._table = perfect_play_table()
+
+    def move(self):
+        square = self._table.best_moves.item(self._game.board_code)
+        return {MoveXs.SIDE: self._side, MoveXs.ROW: square // 3, MoveXs.COLUMN: square % 3}
+
+    def win(self):
+        pass
+
+    def draw(self):
+        pass
+
+    def loss(self):
+        pass
+
+
+OracleScore = namedtuple('OracleScore', ['games', 'moves', 'blunders', 'wins', 'draws', 'losses'])
+
+
+def oracle_score(ai_class, side=Square.Xs, opponent_class=PerfectPlayAI, num_games=100, seed=None):
+    """Play ai_class as side against opponent_class and check each of its moves against perfect play.
+
+    A blunder is a move that turns a won game into a draw or loss, or a drawn one into a loss.  The AIs'
+    win/draw/loss hooks are called as XsAndOsRunner would, so learners carry on learning.
+    """
+    if seed is not None:
+        random.seed(seed)
+    table = perfect_play_table()
+    moves = blunders = wins = draws = losses = 0
+    for _ in range(num_games):
+        game = XsAndOs()
+        ais = {side: ai_class(game, side, side.other_side),
+               side.other_side: opponent_class(game, side.other_side, side)}
+        winner = False
+        for _ in range(9):
+            move = ais[game.next_player].move()
+            if game.next_player == side:
+                moves += 1
+                square = 3 * move[MoveXs.ROW] + move[MoveXs.COLUMN]
+                if not table.optimal_moves.item(game.board_code) >> square & 1:
+                    blunders += 1
+            game.make_move(move)
+            winner = game.check_end_game()
+            if winner:
+                break
+        if not winner:
+            draws += 1
+            ais[side].draw()
+            ais[side.other_side].draw()
+        else:
+            ais[winner].win()
+            ais[winner.other_side].loss()
+            if winner == side:
+                wins += 1
+            else:
+                losses += 1
+    return OracleScore(num_games, moves, blunders, wins, draws, losses)
@@ -0,0 +1,207 @@
+"""Many games of noughts and crosses played in lockstep as NumPy array operations.
+
+Boards are rows of a (K, 9) int8 array indexed by 3 * row + column, holding 1 for Xs, -1 for Os and 0 for
+blank.  Every unfinished game has the same player to move, so a policy picks one square per game for the
+whole batch at once.
+
+    batch = play_batch(random_policy, newell_simon_policy, 10000, seed=0)
+    record_outcomes(batch, StateLearnerAI.stats)      # straight into the learner's statistics
+    replay(batch, StateLearnerAI, NewellSimonAI)      # or through the AIs' win/draw/loss hooks
+"""
+import numpy as np
+
+from learner_stats import DRAWN, LOST, SEEN, WON
+from xsandos import SYMMETRIC_PIECE_KEY_ARRAYS, XSANDOS_ZOBRIST, MoveXs, Square, XsAndOs
+
+
+X = 1
+O = -1
+
+# The rows, columns and diagonals, as square indices
+LINES = np.array([[0, 1, 2], [3, 4, 5], [6, 7, 8],
+                  [0, 3, 6], [1, 4, 7], [2, 5, 8],
+                  [0, 4, 8], [2, 4, 6]])
+
+# LINE_SQUARES[line, square] is 1 where square is on line
+LINE_SQUARES = np.zeros((len(LINES), 9), dtype=np.int8)
+LINE_SQUARES[np.arange(len(LINES))[:, None], LINES] = 1
+
+CENTRE = 4
+CORNERS = np.array([0, 2, 6, 8])
+OPPOSITE_CORNERS = np.array([8, 6, 2, 0])
+# The order NewellSimonAI tries the middle of each side in
+SIDES = np.array([3, 5, 1, 7])
+
+SQUARE_VALUES = {X: Square.Xs, O: Square.Os}
+
+
+class BoardBatch:
+    """K games of noughts and crosses and how each one went.
+
+    moves[k, ply] is the square played at each ply of game k, -1 after the game ended.  winners holds 1
+    for Xs, -1 for Os and 0 for a draw or an unfinished game; done marks the finished games.
+    """
+    def __init__(self, num_games: int):
+        self.boards = np.zeros((num_games, 9), dtype=np.int8)
+        self.moves = np.full((num_games, 9), -1, dtype=np.int8)
+        self.lengths = np.zeros(num_games, dtype=np.int8)
+        self.winners = np.zeros(num_games, dtype=np.int8)
+        self.done = np.zeros(num_games, dtype=bool)
+        self.ply = 0
+
+    def __len__(self):
+        return len(self.boards)
+
+    @property
+    def player(self):
+        return X if self.ply % 2 == 0 else O
+
+    def legal(self):
+        """(K, 9) mask of the empty squares of the unfinished games."""
+        return (self.boards == 0) & ~self.done[:, None]
+
+    def line_sums(self):
+        return self.boards[:, LINES].sum(axis=2, dtype=np.int8)
+
+    def play(self, squares):
+        """Play squares[k] in every unfinished game k and settle the games that end."""
+        player = self.player
+        active = np.flatnonzero(~self.done)
+        self.boards[active, squares[active]] = player
+        self.moves[active, self.ply] = squares[active]
+        self.lengths[active] += 1
+        self.ply += 1
+
+        line_sums = self.line_sums()[active]
+        won = (line_sums == 3 * player).any(axis=1)
+        self.winners[active[won]] = player
+        self.done[active[won]] = True
+        if self.ply == 9:
+            self.done[:] = True
+
+
+def _first(squares_mask, order=None):
+    """The first square of each row of a (K, 9) mask, in order if given, and whether there is one."""
+    if order is not None:
+        squares_mask = squares_mask[:, order]
+    first = squares_mask.argmax(axis=1)
+    return (first if order is None else order[first]), squares_mask.any(axis=1)
+
+
+def random_policy(batch: BoardBatch, rng: np.random.Generator):
+    """A uniformly random empty square per game."""
+    scores = np.where(batch.legal(), rng.random((len(batch), 9)), -1.)
+    return scores.argmax(axis=1)
+
+
+def newell_simon_policy(batch: BoardBatch, rng: np.random.Generator = None):
+    """NewellSimonAI's rules for every game at once: win, block, fork, block a fork, then the best empty square.
+
+    Squares are tried in row-major order within each rule, so a few ties break differently from
+    NewellSimonAI, which scans rows and columns alternately.
+    """
+    me = batch.player
+    legal = batch.legal()
+    line_sums = batch.line_sums()
+
+    def lines_through(target):
+        # How many lines through each square sum to target
+        return (line_sums == target).astype(np.int8) @ LINE_SQUARES
+
+    # A line summing to 2 * me has two of mine and one blank, so the blank wins; 1 * me is one of mine
+    # and two blanks, so taking a blank on it makes a threat
+    my_threats = lines_through(me)
+    their_threats = lines_through(-me)
+    their_forks = legal & (their_threats >= 2)
+    rules = [legal & (lines_through(2 * me) > 0),
+             legal & (lines_through(-2 * me) > 0),
+             legal & (my_threats >= 2),
+             their_forks & (their_forks.sum(axis=1) == 1)[:, None]]
+    # Against two or more forks, make a threat on a line clear of their fork squares so they must block it
+    clear_lines = (line_sums == me) & ((their_forks.astype(np.int8) @ LINE_SQUARES.T) == 0)
+    rules.append(legal & ~their_forks & ((clear_lines.astype(np.int8) @ LINE_SQUARES) > 0) &
+                 (their_forks.sum(axis=1) > 1)[:, None])
+
+    centre = np.zeros_like(legal)
+    centre[:, CENTRE] = legal[:, CENTRE]
+    opposite = np.zeros_like(legal)
+    opposite[:, OPPOSITE_CORNERS] = legal[:, OPPOSITE_CORNERS] & (batch.boards[:, CORNERS] == -me)
+    rules += [centre, opposite]
+
+    squares = np.zeros(len(batch), dtype=np.intp)
+    chosen = np.zeros(len(batch), dtype=bool)
+    for rule, order in [(rule, None) for rule in rules] + [(legal, CORNERS), (legal, SIDES)]:
+        square, found = _first(rule, order)
+        use = found & ~chosen
+        squares[use] = square[use]
+        chosen |= use
+    return squares
+
+
+def play_batch(x_policy, o_policy, num_games: int, seed: int = None):
+    """Play num_games games to the end, with each policy choosing squares for every game it moves in."""
+    rng = np.random.default_rng(seed)
+    batch = BoardBatch(num_games)
+    while not batch.done.all():
+        policy = x_policy if batch.player == X else o_policy
+        batch.play(policy(batch, rng))
+    return batch
+
+
+def canonical_history(batch: BoardBatch, side: Square):
+    """XsAndOs.canonical_history(side) of every game, as a (K, 10) array.
+
+    Row k holds the key of the empty board, then of the board after each of the game's moves; entries past
+    batch.lengths[k] are padding.
+    """
+    num_games = len(batch)
+    board_keys = np.zeros((num_games, 10, 8), dtype=np.uint64)
+    for ply in range(9):
+        square = batch.moves[:, ply].astype(np.intp)
+        played = square >= 0
+        mover = Square.Xs if ply % 2 == 0 else Square.Os
+        step = np.where(played[:, None], SYMMETRIC_PIECE_KEY_ARRAYS[mover][np.maximum(square, 0)], np.uint64(0))
+        board_keys[:, ply + 1] = board_keys[:, ply] ^ step
+    to_move = np.array([XSANDOS_ZOBRIST.side_to_move[Square.Xs if ply % 2 == 0 else Square.Os]
+                        for ply in range(10)], dtype=np.uint64)
+    return board_keys.min(axis=2) ^ to_move ^ np.uint64(XSANDOS_ZOBRIST.owner[side])
+
+
+def record_outcomes(batch: BoardBatch, stats, sides=(Square.Xs, Square.Os)):
+    """Add every game to stats as StateLearnerAI playing each of sides would have recorded it."""
+    keys = []
+    outcomes = []
+    plies = np.arange(10)
+    for side in sides:
+        value = X if side == Square.Xs else O
+        outcome = np.where(batch.winners == value, WON, np.where(batch.winners == -value, LOST, DRAWN))
+        history = canonical_history(batch, side)
+        # Only the positions each game actually reached, one per ply plus the empty board
+        reached = plies[None, :] <= batch.lengths[:, None]
+        keys.append(history[reached])
+        outcomes.append(np.broadcast_to(outcome[:, None], reached.shape)[reached])
+    keys = np.concatenate(keys)
+    outcomes = np.concatenate(outcomes)
+
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    counts = np.zeros((len(unique_keys), 4), dtype=np.int64)
+    counts[:, SEEN] = 1
+    np.add.at(counts, (inverse, outcomes), 1)
+    stats.merge(dict(zip(unique_keys.tolist(), counts.tolist())))
+
+
+def replay(batch: BoardBatch, x_ai_class, o_ai_class):
+    """Replay every game through XsAndOs and the AIs' win/draw/loss hooks, as XsAndOsRunner would."""
+    for k in range(len(batch)):
+        game = XsAndOs()
+        ais = {Square.Xs: x_ai_class(game, Square.Xs, Square.Os), Square.Os: o_ai_class(game, Square.Os, Square.Xs)}
+        for ply in range(batch.lengths[k]):
+            square = int(batch.moves[k, ply])
+            game.make_move({MoveXs.SIDE: game.next_player, MoveXs.ROW: square // 3, MoveXs.COLUMN: square % 3})
+        if batch.winners[k] == 0:
+            ais[Square.Xs].draw()
+            ais[Square.Os].draw()
+        else:
+            winner = SQUARE_VALUES[int(batch.winners[k])]
+            ais[winner].win()
+            ais[winner.other_side].loss()
@@ -0,0 +1,47 @@
+import random
+
+
+def swap_halves(key: int):
+    """The key of the flipped position, for keys drawn with a flip (see ZobristKeys)."""
+    return ((key << 32) & 0xFFFFFFFFFFFFFFFF) | (key >> 32)
+
+
+class ZobristKeys:
+    """Random 64-bit keys for hashing positions incrementally.
+
+    A position key is the XOR of one key per occupied square (per kind of piece), the key of the side to
+    move and, in games with multi-jumps, the key of the square of the piece that must carry on jumping.
+    Keys come from a fixed seed, so every process and every engine for the same game agree on them.
+
+    flip, if given, is (square_map, kind_map, side_map) describing a symmetry of the game that is its own
+    inverse and moves every piece, such as turning the board round and swapping colours.  The keys of
+    each flipped piece, side and pending jump are then the originals with their 32-bit halves swapped, and
+    because that commutes with XOR, swap_halves(position key) is the key of the flipped position.
+    """
+    def __init__(self, num_squares: int, piece_kinds: list, sides: list, seed: int, flip=None):
+        rng = random.Random(seed)
+        self.pieces = {kind: [rng.getrandbits(64) for _ in range(num_squares)] for kind in piece_kinds}
+        self.side_to_move = {side: rng.getrandbits(64) for side in sides}
+        self.pending_jump = [rng.getrandbits(64) for _ in range(num_squares)]
+        # Learners XOR in the key of the side they play for, so the same position seen by each side
+        # is a different state
+        self.owner = {side: rng.getrandbits(64) for side in sides}
+        if flip:
+            square_map, kind_map, side_map = flip
+            self._flip_keys(self.pieces, {(kind, square): (kind_map[kind], square_map[square])
+                                          for kind in piece_kinds for square in range(num_squares)})
+            self._flip_keys(self.side_to_move, side_map)
+            self._flip_keys(self.pending_jump, dict(enumerate(square_map)))
+
+    @staticmethod
+    def _flip_keys(keys, mapping: dict):
+        # Keep the first key of each pair and derive its partner's from it
+        derived = set()
+        for item, image in mapping.items():
+            if item in derived:
+                continue
+            derived.add(image)
+            if isinstance(item, tuple):
+                keys[image[0]][image[1]] = swap_halves(keys[item[0]][item[1]])
+            else:
+                keys[image] = swap_halves(keys[item])